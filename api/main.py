@@ -1,10 +1,23 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .routes import router
+from data_generation.utils import load_config
+from .routes import router, get_prefork_server, get_model_index_watcher, shutdown_model_serving
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fork the inference template process before serving traffic, while this process is still single-threaded.
+    config = load_config('config/config.yaml')
+    if config['deployment'].get('workers', 0) > 0:
+        get_prefork_server(config)
+    get_model_index_watcher(config)
+    yield
+    shutdown_model_serving()
 
 app = FastAPI(
     title="Automated Fine-Tuning Pipeline API",
     description="API for training and deploying fine-tuned LLaMA models",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.include_router(router)
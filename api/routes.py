@@ -1,13 +1,96 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi.responses import PlainTextResponse
 from data_generation.data_generator import generate_synthetic_data
+from data_generation.utils import load_config
 from finetuning.finetune import finetune_model
+from finetuning.sweep import run_sweep, default_sweep_dir, LEADERBOARD_FILENAME
 from deployment.serve_model import ModelServer
+from deployment.prefork import PreforkModelServer
+from deployment.hot_swap import ModelIndexWatcher
+from deployment.model_index import create_staging_dir, publish_model, load_index
 from deployment.utils import get_latest_model_path
-import yaml
+from deployment.metrics import REGISTRY, REQUESTS, REQUESTS_IN_FLIGHT
+from typing import Optional
+import asyncio
+import logging
+import shutil
 import os
 
 router = APIRouter()
 
+_prefork_server = None
+_model_index_watcher = None
+_sweeps = {}
+
+def _model_server_kwargs(config: dict) -> dict:
+    return {
+        "mmap_weights": config['deployment'].get('mmap_weights', True),
+        "warmup": config['deployment'].get('warmup', False),
+        "warmup_prompt": config['deployment'].get('warmup_prompt', "Hello"),
+        "warmup_max_new_tokens": config['deployment'].get('warmup_max_new_tokens', 4),
+        "backend": config['deployment'].get('backend', "torch"),
+        "onnx_int8": config['deployment'].get('onnx_int8', False),
+        "log_sample_rate": config['deployment'].get('log_sample_rate', 0.0),
+    }
+
+def get_prefork_server(config: dict) -> PreforkModelServer:
+    """
+    Returns the shared pre-forked worker pool, creating it on first use.
+
+    The latest fine-tuned model, if any, is loaded in this process before forking so that
+    every worker shares its weights.
+    """
+    global _prefork_server
+    if _prefork_server is None:
+        try:
+            preload = [get_latest_model_path(config['model']['finetuned_model_dir'])]
+        except FileNotFoundError:
+            preload = []
+        _prefork_server = PreforkModelServer(
+            preload,
+            num_workers=config['deployment']['workers'],
+            threads_per_worker=config['deployment'].get('threads_per_worker', 1),
+            **_model_server_kwargs(config),
+        )
+    return _prefork_server
+
+def get_model_index_watcher(config: dict) -> ModelIndexWatcher:
+    """
+    Returns the shared model index watcher, creating and starting it on first use.
+    """
+    global _model_index_watcher
+    if _model_index_watcher is None:
+        server_kwargs = _model_server_kwargs(config)
+
+        if config['deployment'].get('workers', 0) > 0:
+            prefork_server = get_prefork_server(config)
+            load_model = prefork_server.load_model
+            unload_model = prefork_server.evict_model
+        else:
+            def load_model(model_path: str) -> None:
+                ModelServer(model_path, **server_kwargs)
+
+            unload_model = ModelServer.evict
+
+        _model_index_watcher = ModelIndexWatcher(
+            config['model']['finetuned_model_dir'],
+            load_model,
+            unload_model,
+            poll_interval=config['deployment'].get('index_poll_interval', 2.0),
+            pinned_idle_timeout=config['deployment'].get('pinned_model_idle_seconds', 300.0),
+        )
+        _model_index_watcher.start()
+    return _model_index_watcher
+
+def shutdown_model_serving() -> None:
+    global _prefork_server, _model_index_watcher
+    if _model_index_watcher is not None:
+        _model_index_watcher.stop()
+        _model_index_watcher = None
+    if _prefork_server is not None:
+        _prefork_server.shutdown()
+        _prefork_server = None
+
 @router.post("/train", summary="Train a fine-tuned model based on a use case")
 async def train(use_case: str):
     try:
@@ -16,24 +99,97 @@ async def train(use_case: str):
         if not data:
             raise ValueError("No data generated for the given use case.")
 
-        # Fine-tune the model
-        config = yaml.safe_load(open('config/config.yaml'))
-        output_dir = os.path.join(config['model']['finetuned_model_dir'], f"finetuned_{use_case.replace(' ', '_')}")
-        os.makedirs(output_dir, exist_ok=True)
+        # Fine-tune into a staging directory, then publish it atomically
+        config = load_config('config/config.yaml')
+        model_dir = config['model']['finetuned_model_dir']
+        staging_dir = create_staging_dir(model_dir)
+        try:
+            finetune_model(data, staging_dir, use_case)
+            entry = publish_model(staging_dir, model_dir, use_case)
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
 
-        finetune_model(data, output_dir)
-
-        return {"status": "fine-tuning completed", "model_path": output_dir}
+        return {
+            "status": "fine-tuning completed",
+            "model_path": os.path.join(model_dir, entry['path']),
+            "version": entry['version'],
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/predict", summary="Get prediction from the latest fine-tuned model")
-async def predict(prompt: str):
+def _run_sweep_task(sweep_id: str, use_case: str, sweep_dir: str, config: dict) -> None:
+    status = _sweeps[sweep_id]
+    try:
+        data = generate_synthetic_data(use_case)
+        if not data:
+            raise ValueError("No data generated for the given use case.")
+
+        result = run_sweep(data, use_case, config, sweep_dir)
+        published = result['published']
+        status.update({
+            "status": "completed",
+            "best": {key: result['best'][key] for key in ("trial_id", "params", "steps", "eval_loss")},
+            "version": published['version'] if published else None,
+        })
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Sweep {sweep_id} failed: {str(e)}")
+        status.update({"status": "failed", "error": str(e)})
+
+@router.post("/sweep", summary="Start a hyperparameter sweep for a use case that publishes the best model")
+async def sweep(use_case: str, background_tasks: BackgroundTasks):
+    # A sweep trains many models; run it after responding, off the event loop.
+    config = load_config('config/config.yaml')
+    sweep_dir = default_sweep_dir(config, use_case)
+    sweep_id = os.path.basename(sweep_dir)
+    _sweeps[sweep_id] = {
+        "status": "running",
+        "use_case": use_case,
+        "leaderboard": os.path.join(sweep_dir, LEADERBOARD_FILENAME),
+    }
+    background_tasks.add_task(_run_sweep_task, sweep_id, use_case, sweep_dir, config)
+    return {"sweep_id": sweep_id, **_sweeps[sweep_id]}
+
+@router.get("/sweep/{sweep_id}", summary="Get the status of a hyperparameter sweep")
+async def sweep_status(sweep_id: str):
+    if sweep_id not in _sweeps:
+        raise HTTPException(status_code=404, detail=f"Unknown sweep {sweep_id}.")
+    return {"sweep_id": sweep_id, **_sweeps[sweep_id]}
+
+@router.post("/predict", summary="Get prediction from a published fine-tuned model")
+async def predict(prompt: str, use_case: Optional[str] = None, version: Optional[int] = None):
+    REQUESTS_IN_FLIGHT.inc()
     try:
-        config = yaml.safe_load(open('config/config.yaml'))
-        model_path = get_latest_model_path(config['model']['finetuned_model_dir'])
-        server = ModelServer(model_path)
-        prediction = server.predict(prompt)
+        config = load_config('config/config.yaml')
+        with get_model_index_watcher(config).use(use_case, version) as model_path:
+            if config['deployment'].get('workers', 0) > 0:
+                # Sending can block on a busy worker's pipe; keep it off the event loop.
+                future = await asyncio.to_thread(get_prefork_server(config).submit, model_path, prompt)
+                prediction = await asyncio.wrap_future(future)
+            else:
+                server = ModelServer(model_path, **_model_server_kwargs(config))
+                prediction = server.predict(prompt)
+        REQUESTS.inc(status="ok")
         return {"prediction": prediction}
+    except FileNotFoundError as e:
+        # No published model matches the use case and version.
+        REQUESTS.inc(status="not_found")
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
+        REQUESTS.inc(status="error")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
+
+@router.get("/models", summary="List published models")
+async def models():
+    config = load_config('config/config.yaml')
+    return load_index(config['model']['finetuned_model_dir'])
+
+@router.get("/metrics", summary="Serving metrics in the Prometheus text format", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=REGISTRY.CONTENT_TYPE)
+
+@router.get("/startup-metrics", summary="Get cold-start metrics of the loaded models")
+async def startup_metrics():
+    return {"models": ModelServer.get_startup_metrics()}
@@ -0,0 +1,94 @@
+import json
+import logging
+import torch
+from types import SimpleNamespace
+from typing import List, Dict
+from tokenizers import Tokenizer, models, pre_tokenizers, trainers
+from transformers import PreTrainedTokenizerFast, LlamaConfig, LlamaForCausalLM
+
+SPECIAL_TOKENS = ["<pad>", "<s>", "</s>", "<unk>"]
+
+def load_sample_data(path: str = 'data_generation/health_recommendation_dataset.json') -> List[Dict[str, str]]:
+    """
+    Loads the bundled sample dataset used as benchmark input.
+
+    Args:
+        path (str): Path to a JSON list of {"input", "output"} samples.
+
+    Returns:
+        List[Dict[str, str]]: The samples.
+    """
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def build_tiny_model(output_dir: str,
+                     raw_data: List[Dict[str, str]],
+                     hidden_size: int = 64,
+                     num_hidden_layers: int = 2,
+                     seed: int = 42) -> str:
+    """
+    Saves a randomly initialized tiny Llama model and a word-level tokenizer to `output_dir`.
+
+    The tokenizer vocabulary is trained on `raw_data`, so nothing is downloaded and the
+    directory can be loaded with `AutoTokenizer`/`AutoModelForCausalLM` like a real checkpoint.
+
+    Args:
+        output_dir (str): Directory to write the model and tokenizer to.
+        raw_data (List[Dict[str, str]]): Samples used to build the vocabulary.
+        hidden_size (int): Hidden size of the model. Defaults to 64.
+        num_hidden_layers (int): Number of decoder layers. Defaults to 2.
+        seed (int): Seed for the random weight initialization. Defaults to 42.
+
+    Returns:
+        str: The output directory.
+    """
+    logger = logging.getLogger(__name__)
+
+    corpus = [item['input'] for item in raw_data] + [item['output'] for item in raw_data]
+    backend = Tokenizer(models.WordLevel(unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.Whitespace()
+    backend.train_from_iterator(corpus, trainers.WordLevelTrainer(special_tokens=SPECIAL_TOKENS))
+
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=backend,
+        pad_token="<pad>",
+        bos_token="<s>",
+        eos_token="</s>",
+        unk_token="<unk>",
+        model_input_names=["input_ids", "attention_mask"],
+        clean_up_tokenization_spaces=False,
+    )
+    tokenizer.save_pretrained(output_dir)
+
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=num_hidden_layers,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=1024,
+        pad_token_id=tokenizer.pad_token_id,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        tie_word_embeddings=True,
+    )
+    model = LlamaForCausalLM(config)
+    model.save_pretrained(output_dir)
+    logger.info(f"Saved tiny model ({model.num_parameters()} parameters) to {output_dir}")
+
+    return output_dir
+
+class StubCompletionClient:
+    """
+    Offline stand-in for the `OpenAI` client used by `generate_synthetic_data`.
+
+    It accepts the same constructor arguments and answers every chat completion
+    with a fixed dataset rendered the way the real API tends to: a short preamble
+    followed by the JSON list.
+    """
+    def __init__(self, raw_data: List[Dict[str, str]], **kwargs):
+        content = "Here is the generated dataset:\n" + json.dumps(raw_data, indent=4)
+        response = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=lambda **_: response))
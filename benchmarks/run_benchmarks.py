@@ -0,0 +1,365 @@
+import os
+import sys
+import shutil
+import json
+import time
+import logging
+import platform
+import argparse
+import tempfile
+import threading
+import statistics
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+from unittest.mock import patch
+
+import torch
+import transformers
+from transformers import AutoTokenizer, AutoModelForCausalLM, TrainerCallback, TrainingArguments
+
+from data_generation.utils import load_config
+from data_generation.data_generator import generate_synthetic_data
+from finetuning.trainer import prepare_trainer
+from finetuning.utils import preprocess_data
+from finetuning.export import export_onnx
+from deployment.serve_model import ModelServer
+from deployment.prefork import PreforkModelServer
+from deployment.model_index import create_staging_dir, publish_model
+from .fixtures import load_sample_data, build_tiny_model, StubCompletionClient
+
+logger = logging.getLogger(__name__)
+
+def _metric(value: float, unit: str, higher_is_better: bool) -> Dict:
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+def bench_generation_parse(raw_data: List[Dict[str, str]], repeats: int = 20) -> Dict[str, Dict]:
+    """
+    Measures how fast `generate_synthetic_data` turns a completion into validated samples.
+
+    The completion API is replaced by `StubCompletionClient`, so this covers prompt
+    construction, response parsing and validation only.
+    """
+    with patch('data_generation.data_generator.OpenAI', lambda **kwargs: StubCompletionClient(raw_data, **kwargs)):
+        generate_synthetic_data("benchmark", num_samples=len(raw_data))
+        start = time.perf_counter()
+        for _ in range(repeats):
+            data = generate_synthetic_data("benchmark", num_samples=len(raw_data))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "generation_parse.samples_per_sec": _metric(repeats * len(data) / elapsed, "samples/s", True),
+    }
+
+def bench_preprocess(raw_data: List[Dict[str, str]], tokenizer, max_length: int, repeats: int = 5) -> Dict[str, Dict]:
+    """
+    Measures `preprocess_data` throughput in rows per second.
+    """
+    preprocess_data(raw_data, tokenizer, max_length=max_length)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        preprocess_data(raw_data, tokenizer, max_length=max_length)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "preprocess.rows_per_sec": _metric(repeats * len(raw_data) / elapsed, "rows/s", True),
+    }
+
+class _StepTimer(TrainerCallback):
+    """Records the wall-clock time at the end of every optimizer step."""
+    def __init__(self):
+        self.step_times = []
+
+    def on_step_end(self, args, state, control, **kwargs):
+        self.step_times.append(time.perf_counter())
+
+def bench_training(raw_data: List[Dict[str, str]], model_path: str, work_dir: str,
+                   max_length: int, steps: int, batch_size: int) -> Dict[str, Dict]:
+    """
+    Measures training steps/sec and tokens/sec through `prepare_trainer`.
+
+    The first step is treated as warmup and excluded from the rates.
+    """
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForCausalLM.from_pretrained(model_path)
+    dataset = preprocess_data(raw_data, tokenizer, max_length=max_length)
+
+    training_args = TrainingArguments(
+        output_dir=os.path.join(work_dir, "bench_training"),
+        max_steps=steps,
+        per_device_train_batch_size=batch_size,
+        learning_rate=2e-5,
+        save_strategy="no",
+        logging_strategy="no",
+        evaluation_strategy="no",
+        report_to=[],
+        disable_tqdm=True,
+        use_cpu=True,
+        seed=42,
+    )
+    trainer = prepare_trainer(model, tokenizer, training_args, dataset)
+    timer = _StepTimer()
+    trainer.add_callback(timer)
+    trainer.train()
+
+    timed_steps = len(timer.step_times) - 1
+    elapsed = timer.step_times[-1] - timer.step_times[0]
+    steps_per_sec = timed_steps / elapsed
+
+    return {
+        "training.steps_per_sec": _metric(steps_per_sec, "steps/s", True),
+        "training.tokens_per_sec": _metric(steps_per_sec * batch_size * max_length, "tokens/s", True),
+    }
+
+def bench_cold_load(model_path: str, repeats: int) -> Dict[str, Dict]:
+    """
+    Measures `ModelServer` construction time with empty model and tokenizer caches,
+    and, separately, the time to the first generated token reported by the warmup.
+
+    The cold load is timed without warmup so it stays comparable with older results.
+    """
+    timings = []
+    first_token_timings = []
+    for _ in range(repeats):
+        ModelServer._model_cache.clear()
+        ModelServer._tokenizer_cache.clear()
+        start = time.perf_counter()
+        ModelServer(model_path)
+        timings.append((time.perf_counter() - start) * 1000)
+
+        ModelServer._model_cache.clear()
+        ModelServer._tokenizer_cache.clear()
+        ModelServer(model_path, warmup=True)
+        first_token_timings.append(ModelServer.get_startup_metrics()[model_path]['first_token_ms'])
+    ModelServer._model_cache.clear()
+    ModelServer._tokenizer_cache.clear()
+
+    return {
+        "model_server.cold_load_ms": _metric(statistics.median(timings), "ms", False),
+        "model_server.first_token_ms": _metric(statistics.median(first_token_timings), "ms", False),
+    }
+
+def bench_backends(model_path: str, prompts: List[str], max_length: int) -> Dict[str, Dict]:
+    """
+    Measures generated tokens/sec of `ModelServer.predict` on each inference backend.
+    """
+    export_onnx(model_path, quantize_int8=True)
+    metrics = {}
+    for name, kwargs in (("torch", {}), ("onnx", {"backend": "onnx"}), ("onnx_int8", {"backend": "onnx", "onnx_int8": True})):
+        server = ModelServer(model_path, warmup=True, **kwargs)
+        tokenizer = server.tokenizer
+        generated = 0
+        start = time.perf_counter()
+        for prompt in prompts:
+            prediction = server.predict(prompt, max_length=max_length)
+            generated += len(tokenizer(prediction)['input_ids']) - len(tokenizer(prompt)['input_ids'])
+        elapsed = time.perf_counter() - start
+        metrics[f"backend.{name}.tokens_per_sec"] = _metric(generated / elapsed, "tokens/s", True)
+    ModelServer.evict(model_path)
+    return metrics
+
+def bench_predict_latency(model_path: str, prompts: List[str], concurrent_clients: int,
+                          requests_per_client: int, port: int = 0) -> Dict[str, Dict]:
+    """
+    Measures `/predict` latency under `concurrent_clients` clients against a live uvicorn server.
+
+    The model is published to a temporary model index that the API is pointed at.
+    """
+    import uvicorn
+    from api.main import app
+
+    config = load_config('config/config.yaml')
+    config['model']['finetuned_model_dir'] = tempfile.mkdtemp()
+    staging_dir = create_staging_dir(config['model']['finetuned_model_dir'])
+    shutil.copytree(model_path, staging_dir, dirs_exist_ok=True)
+    publish_model(staging_dir, config['model']['finetuned_model_dir'], "benchmark")
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+
+    with patch('api.main.load_config', return_value=config), patch('api.routes.load_config', return_value=config):
+        thread.start()
+        while not server.started:
+            time.sleep(0.01)
+        bound_port = server.servers[0].sockets[0].getsockname()[1]
+        url = f"http://127.0.0.1:{bound_port}/predict"
+
+        def send(prompt: str) -> float:
+            request = urllib.request.Request(f"{url}?{urllib.parse.urlencode({'prompt': prompt})}", method="POST")
+            start = time.perf_counter()
+            with urllib.request.urlopen(request) as response:
+                response.read()
+            return (time.perf_counter() - start) * 1000
+
+        # Warm the model cache so the first client does not pay the cold load.
+        send(prompts[0])
+
+        def client(client_id: int) -> List[float]:
+            return [send(prompts[(client_id + i) % len(prompts)]) for i in range(requests_per_client)]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrent_clients) as pool:
+            latencies = [latency for result in pool.map(client, range(concurrent_clients)) for latency in result]
+        elapsed = time.perf_counter() - start
+
+        server.should_exit = True
+        thread.join()
+    shutil.rmtree(config['model']['finetuned_model_dir'])
+
+    return {
+        "predict.p50_ms": _metric(_percentile(latencies, 50), "ms", False),
+        "predict.p99_ms": _metric(_percentile(latencies, 99), "ms", False),
+        "predict.requests_per_sec": _metric(len(latencies) / elapsed, "requests/s", True),
+    }
+
+def bench_prefork(model_path: str, prompts: List[str], num_workers: int, concurrent_clients: int,
+                  requests_per_client: int) -> Dict[str, Dict]:
+    """
+    Measures `PreforkModelServer` throughput and the private memory each worker adds
+    on top of the weights shared with the parent.
+    """
+    server = PreforkModelServer([model_path], num_workers=num_workers, warmup=True)
+    try:
+        server.predict(model_path, prompts[0])
+
+        def client(client_id: int) -> None:
+            for i in range(requests_per_client):
+                server.predict(model_path, prompts[(client_id + i) % len(prompts)])
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrent_clients) as pool:
+            list(pool.map(client, range(concurrent_clients)))
+        elapsed = time.perf_counter() - start
+
+        private_bytes = [worker['private_bytes'] or 0 for worker in server.stats()]
+    finally:
+        server.shutdown()
+
+    return {
+        "prefork.requests_per_sec": _metric(concurrent_clients * requests_per_client / elapsed, "requests/s", True),
+        "prefork.worker_private_mb": _metric(max(private_bytes) / 2 ** 20, "MB", False),
+    }
+
+def run_benchmarks(config: dict) -> Dict:
+    """
+    Runs the full benchmark suite on a tiny offline model.
+
+    Args:
+        config (dict): The `benchmark` section of the configuration.
+
+    Returns:
+        Dict: Environment metadata and a mapping of metric name to value, unit and direction.
+    """
+    torch.manual_seed(config.get('seed', 42))
+    raw_data = load_sample_data()[:config['num_samples']]
+    prompts = [item['input'] for item in raw_data]
+    metrics = {}
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        model_path = build_tiny_model(os.path.join(work_dir, "tiny_model"), raw_data)
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+
+        logger.info("Benchmarking synthetic data parsing...")
+        metrics.update(bench_generation_parse(raw_data))
+        logger.info("Benchmarking preprocessing...")
+        metrics.update(bench_preprocess(raw_data, tokenizer, config['max_length']))
+        logger.info("Benchmarking training...")
+        metrics.update(bench_training(raw_data, model_path, work_dir, config['max_length'],
+                                      config['train_steps'], config['train_batch_size']))
+        logger.info("Benchmarking model cold load...")
+        metrics.update(bench_cold_load(model_path, config['cold_load_repeats']))
+        logger.info("Benchmarking inference backends...")
+        metrics.update(bench_backends(model_path, prompts[:config['backend_prompts']], config['max_length']))
+        logger.info("Benchmarking /predict latency...")
+        metrics.update(bench_predict_latency(model_path, prompts, config['concurrent_clients'],
+                                             config['requests_per_client']))
+        logger.info("Benchmarking pre-forked workers...")
+        metrics.update(bench_prefork(model_path, prompts, config['prefork_workers'],
+                                     config['concurrent_clients'], config['requests_per_client']))
+
+    return {
+        "metadata": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "torch_threads": torch.get_num_threads(),
+            "config": config,
+        },
+        "metrics": metrics,
+    }
+
+def compare_results(current: Dict, baseline: Dict, tolerance: float) -> List[Dict]:
+    """
+    Compares benchmark results against a stored baseline.
+
+    A metric regresses when it moves in its bad direction by more than `tolerance`
+    (a fraction of the baseline value). Metrics missing from either side are ignored.
+
+    Args:
+        current (Dict): Results from `run_benchmarks`.
+        baseline (Dict): Previously saved results.
+        tolerance (float): Allowed relative change, e.g. 0.2 for 20%.
+
+    Returns:
+        List[Dict]: One entry per regressed metric with baseline, current and relative change.
+    """
+    regressions = []
+    for name, base in baseline['metrics'].items():
+        if name not in current['metrics'] or base['value'] == 0:
+            continue
+        value = current['metrics'][name]['value']
+        change = (value - base['value']) / base['value']
+        regressed = change < -tolerance if base['higher_is_better'] else change > tolerance
+        if regressed:
+            regressions.append({
+                "metric": name,
+                "baseline": base['value'],
+                "current": value,
+                "change": change,
+            })
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the offline performance benchmark suite.")
+    parser.add_argument("--config", default="config/config.yaml", help="Path to the pipeline configuration.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the results JSON.")
+    parser.add_argument("--baseline", help="Baseline results JSON to compare against.")
+    parser.add_argument("--tolerance", type=float, help="Allowed relative change before flagging a regression.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    config = load_config(args.config)['benchmark']
+
+    results = run_benchmarks(config)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=4)
+    logger.info(f"Benchmark results saved to {args.output}")
+
+    for name, metric in results['metrics'].items():
+        print(f"{name:40s} {metric['value']:12.2f} {metric['unit']}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        tolerance = args.tolerance if args.tolerance is not None else config['tolerance']
+        regressions = compare_results(results, baseline, tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['metric']}: {regression['baseline']:.2f} -> "
+                  f"{regression['current']:.2f} ({regression['change']:+.1%})")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.baseline} (tolerance {tolerance:.0%}).")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -40,10 +40,10 @@ def generate_synthetic_data(use_case: str,
     **Dataset Structure:**
     ```json
     [
-        {
+        {{
             "input": "<input_text>",
             "output": "<output_text>"
-        },
+        }},
         ...
     ]
     ```
@@ -51,14 +51,14 @@ def generate_synthetic_data(use_case: str,
     **Two-Shot Examples:**
     ```json
     [
-        {
+        {{
             "input": "How can I reset my password?",
             "output": "To reset your password, click on 'Forgot Password' on the login page and follow the instructions sent to your email."
-        },
-        {
+        }},
+        {{
             "input": "What is the refund policy?",
             "output": "Our refund policy allows you to return products within 30 days of purchase for a full refund, provided the items are in original condition."
-        }
+        }}
     ]
     """
     
@@ -0,0 +1,201 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+from .model_index import INDEX_FILENAME, load_index, find_model
+from .utils import get_latest_model_path
+
+class ModelIndexWatcher:
+    """
+    Tracks which model version serves each use case and hot-swaps to newly published versions.
+
+    Requests take the current model path for their use case through `use`, which also counts
+    them as in flight. A background thread polls the model index; when a newer version of a
+    use case that is being served appears, it is loaded and warmed up through `load_model`
+    while traffic keeps going to the old version. The new version is then swapped in, and
+    the old one is released through `unload_model` once its in-flight requests have drained.
+    Versions that requests pin explicitly are released once they have been idle for
+    `pinned_idle_timeout` seconds.
+    """
+    def __init__(self, model_dir: str,
+                 load_model: Callable[[str], None],
+                 unload_model: Callable[[str], None],
+                 poll_interval: float = 2.0,
+                 pinned_idle_timeout: float = 300.0):
+        """
+        Args:
+            model_dir (str): Directory containing fine-tuned models and the model index.
+            load_model (Callable[[str], None]): Loads and warms up the model at a path.
+            unload_model (Callable[[str], None]): Releases the model at a path.
+            poll_interval (float): Seconds between checks of the model index. Defaults to 2.0.
+            pinned_idle_timeout (float): Seconds a pinned version that is not the active one
+                stays loaded after its last request. Defaults to 300.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.model_dir = model_dir
+        self.load_model = load_model
+        self.unload_model = unload_model
+        self.poll_interval = poll_interval
+        self.pinned_idle_timeout = pinned_idle_timeout
+
+        self._condition = threading.Condition()
+        self._active: Dict[Optional[str], str] = {}
+        self._pinned: Dict[Tuple[Optional[str], int], str] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._idle_since: Dict[str, float] = {}
+        self._draining = set()
+        self._index_mtime = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _resolve(self, use_case: Optional[str], version: Optional[int] = None) -> str:
+        entry = find_model(load_index(self.model_dir), use_case, version)
+        if entry is not None:
+            return os.path.join(self.model_dir, entry['path'])
+        if use_case is None and version is None:
+            # No published models yet: serve the newest model directory as before.
+            return get_latest_model_path(self.model_dir)
+        raise FileNotFoundError(f"No published model for use case {use_case!r} version {version!r} in {self.model_dir}.")
+
+    @contextmanager
+    def use(self, use_case: Optional[str] = None, version: Optional[int] = None):
+        """
+        Yields the model path to serve a request with, keeping it from being unloaded until the block exits.
+
+        Args:
+            use_case (Optional[str]): Use case to serve. None serves the most recently published model.
+            version (Optional[int]): Pin a specific version instead of following the latest one.
+
+        Raises:
+            FileNotFoundError: If no published model matches.
+        """
+        # Published versions never change, so a pinned version is only looked up once. The
+        # index is read outside the lock so that other requests do not wait on the disk.
+        with self._condition:
+            model_path = self._active.get(use_case) if version is None else self._pinned.get((use_case, version))
+            if model_path is not None:
+                self._acquire(model_path)
+
+        if model_path is None:
+            resolved = self._resolve(use_case, version)
+            with self._condition:
+                if version is None:
+                    model_path = self._active.setdefault(use_case, resolved)
+                else:
+                    model_path = self._pinned.setdefault((use_case, version), resolved)
+                self._acquire(model_path)
+
+        try:
+            yield model_path
+        finally:
+            with self._condition:
+                self._in_flight[model_path] -= 1
+                if self._in_flight[model_path] == 0:
+                    del self._in_flight[model_path]
+                    if model_path in self._draining:
+                        self._condition.notify_all()
+                    elif model_path not in self._active.values():
+                        self._idle_since[model_path] = time.monotonic()
+
+    def _acquire(self, model_path: str) -> None:
+        # Callers hold self._condition.
+        self._in_flight[model_path] = self._in_flight.get(model_path, 0) + 1
+        self._idle_since.pop(model_path, None)
+
+    def refresh(self) -> None:
+        """
+        Swaps every served use case whose latest published version changed, then unloads drained models.
+        """
+        with self._condition:
+            active = dict(self._active)
+
+        index = load_index(self.model_dir)
+        for use_case, current_path in active.items():
+            entry = find_model(index, use_case)
+            if entry is None:
+                continue
+            latest_path = os.path.join(self.model_dir, entry['path'])
+            if latest_path == current_path:
+                continue
+
+            self.logger.info(f"Loading {entry['use_case']!r} v{entry['version']} before swapping it in.")
+            try:
+                self.load_model(latest_path)
+            except Exception as e:
+                self.logger.error(f"Failed to load {latest_path}; keeping {current_path}: {str(e)}")
+                continue
+
+            with self._condition:
+                self._active[use_case] = latest_path
+                self._draining.add(current_path)
+            self.logger.info(f"Swapped {current_path} -> {latest_path}")
+
+        self._unload_drained()
+
+    def _unload_drained(self) -> None:
+        with self._condition:
+            active = set(self._active.values())
+            drained = [
+                path for path in self._draining
+                if path not in self._in_flight and path not in active
+            ]
+            self._draining.difference_update(drained)
+            # A drained path that is active again (e.g. republished under the same name) stays loaded.
+            self._draining.difference_update(active)
+
+            now = time.monotonic()
+            idle = [
+                path for path, since in self._idle_since.items()
+                if now - since >= self.pinned_idle_timeout and path not in active and path not in drained
+            ]
+            for path in drained + idle + [path for path in self._idle_since if path in active]:
+                self._idle_since.pop(path, None)
+
+        for path in drained:
+            self.unload_model(path)
+            self.logger.info(f"Unloaded drained model {path}")
+        for path in idle:
+            self.unload_model(path)
+            self.logger.info(f"Unloaded idle pinned model {path}")
+
+    def _index_changed(self) -> bool:
+        try:
+            mtime = os.stat(os.path.join(self.model_dir, INDEX_FILENAME)).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        changed = mtime != self._index_mtime
+        self._index_mtime = mtime
+        return changed
+
+    def _watch(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                if self._index_changed():
+                    self.refresh()
+                else:
+                    self._unload_drained()
+            except Exception as e:
+                self.logger.error(f"Model index refresh failed: {str(e)}")
+
+            with self._condition:
+                self._condition.wait(self.poll_interval)
+
+    def start(self) -> None:
+        """
+        Starts watching the model index in a background thread.
+        """
+        self._index_changed()
+        self._thread = threading.Thread(target=self._watch, name="model-index-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the background thread.
+        """
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,172 @@
+import json
+import math
+import random
+import logging
+import threading
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+THROUGHPUT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    """A monotonically increasing value."""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {} if labelnames else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        with self._lock:
+            return [
+                f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())
+            ]
+
+class Gauge(_Metric):
+    """A value that can go up and down, or is computed when scraped."""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self._value = 0.0
+        self._function = function
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = value
+
+    def value(self) -> float:
+        return self._function() if self._function is not None else self._value
+
+    def _samples(self):
+        return [f"{self.name} {_format_value(self.value())}"]
+
+class Histogram(_Metric):
+    """Counts observations into cumulative buckets, with their sum and count."""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[index] += 1
+                    break
+            self._sum += value
+
+    def count(self) -> int:
+        return sum(self._counts)
+
+    def _samples(self):
+        with self._lock:
+            lines = []
+            cumulative = 0
+            for bound, count in zip(self.buckets, self._counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{le="{_format_value(bound)}"}} {cumulative}')
+            lines.append(f"{self.name}_sum {_format_value(self._sum)}")
+            lines.append(f"{self.name}_count {cumulative}")
+            return lines
+
+class MetricsRegistry:
+    """Holds metrics and renders them in the Prometheus text exposition format."""
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+TOKENIZE_SECONDS = REGISTRY.register(Histogram("llm_tokenize_seconds", "Time spent tokenizing the prompt."))
+PREFILL_SECONDS = REGISTRY.register(Histogram("llm_prefill_seconds", "Time from the start of generation to the first generated token."))
+DECODE_SECONDS = REGISTRY.register(Histogram("llm_decode_seconds", "Time spent generating tokens after the first one."))
+REQUEST_SECONDS = REGISTRY.register(Histogram("llm_request_seconds", "Total prediction time, from tokenization to the decoded text."))
+DECODE_TOKENS_PER_SECOND = REGISTRY.register(Histogram("llm_decode_tokens_per_second", "Per-request generation throughput.", THROUGHPUT_BUCKETS))
+BATCH_SIZE = REGISTRY.register(Histogram("llm_batch_size", "Number of sequences generated per forward pass.", BATCH_SIZE_BUCKETS))
+PROMPT_TOKENS = REGISTRY.register(Counter("llm_prompt_tokens_total", "Prompt tokens processed."))
+GENERATED_TOKENS = REGISTRY.register(Counter("llm_generated_tokens_total", "Tokens generated."))
+MODEL_CACHE_REQUESTS = REGISTRY.register(Counter("llm_model_cache_requests_total", "Predictions served by a cached or a freshly loaded model.", ["result"]))
+REQUESTS = REGISTRY.register(Counter("llm_requests_total", "Prediction requests handled.", ["status"]))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge("llm_requests_in_flight", "Prediction requests currently being served or queued."))
+
+def record_prediction(timings: Dict, model_path: str, log_sample_rate: float = 0.0) -> None:
+    """
+    Records the latency breakdown of one prediction and logs a sampled structured summary of it.
+
+    Only sizes and timings are logged, never the prompt or prediction text.
+
+    Args:
+        timings (Dict): Timings and token counts from `ModelServer.generate_with_timings`.
+        model_path (str): Model that served the prediction.
+        log_sample_rate (float): Fraction of predictions to log. Defaults to 0.
+    """
+    TOKENIZE_SECONDS.observe(timings['tokenize_seconds'])
+    PREFILL_SECONDS.observe(timings['prefill_seconds'])
+    DECODE_SECONDS.observe(timings['decode_seconds'])
+    REQUEST_SECONDS.observe(timings['total_seconds'])
+    BATCH_SIZE.observe(timings['batch_size'])
+    PROMPT_TOKENS.inc(timings['prompt_tokens'])
+    GENERATED_TOKENS.inc(timings['generated_tokens'])
+    if timings['decode_seconds'] > 0:
+        DECODE_TOKENS_PER_SECOND.observe(max(timings['generated_tokens'] - 1, 0) / timings['decode_seconds'])
+    MODEL_CACHE_REQUESTS.inc(result="hit" if timings['model_cache_hit'] else "miss")
+
+    if log_sample_rate > 0 and random.random() < log_sample_rate:
+        logging.getLogger(__name__).info(json.dumps({"event": "prediction", "model": model_path, **timings}))
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import logging
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+INDEX_FILENAME = "index.json"
+STAGING_DIRNAME = ".staging"
+LOCK_FILENAME = ".index.lock"
+
+def _use_case_dirname(use_case: str) -> str:
+    return f"finetuned_{use_case.replace(' ', '_')}"
+
+@contextmanager
+def _index_lock(model_dir: str):
+    """Serializes publishers across processes with an exclusive lock file."""
+    with open(os.path.join(model_dir, LOCK_FILENAME), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def load_index(model_dir: str) -> Dict:
+    """
+    Loads the model index manifest.
+
+    Args:
+        model_dir (str): Directory containing fine-tuned models.
+
+    Returns:
+        Dict: The manifest, with an empty model list if no model has been published yet.
+    """
+    index_path = os.path.join(model_dir, INDEX_FILENAME)
+    if not os.path.exists(index_path):
+        return {"models": []}
+    with open(index_path, 'r') as f:
+        return json.load(f)
+
+def _write_index(model_dir: str, index: Dict) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=model_dir, prefix=".index-", suffix=".json")
+    with os.fdopen(fd, 'w') as f:
+        json.dump(index, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(model_dir, INDEX_FILENAME))
+
+def compute_model_hash(path: str) -> str:
+    """
+    Computes a SHA-256 digest over the relative paths and contents of every file in a model directory.
+    """
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            digest.update(os.path.relpath(file_path, path).encode())
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+def create_staging_dir(model_dir: str) -> str:
+    """
+    Creates a private directory to write a model into before it is published.
+
+    The directory lives inside `model_dir` so that publishing is a same-filesystem rename,
+    and is hidden from `get_latest_model_path`.
+
+    Args:
+        model_dir (str): Directory containing fine-tuned models.
+
+    Returns:
+        str: Path to the new staging directory.
+    """
+    staging_root = os.path.join(model_dir, STAGING_DIRNAME)
+    os.makedirs(staging_root, exist_ok=True)
+    return tempfile.mkdtemp(dir=staging_root)
+
+def publish_model(staging_dir: str, model_dir: str, use_case: str, metrics: Optional[Dict] = None) -> Dict:
+    """
+    Atomically publishes a fully written model as the next version of a use case.
+
+    The staging directory is renamed into `<model_dir>/finetuned_<use_case>/v<version>` and
+    the model is only then recorded in the index, so readers never see a partially written model.
+
+    Args:
+        staging_dir (str): Directory holding the complete model, e.g. from `create_staging_dir`.
+        model_dir (str): Directory containing fine-tuned models.
+        use_case (str): The use case the model was fine-tuned for.
+        metrics (Optional[Dict]): Metrics to record with the model. Defaults to the
+            `training_metrics.json` in the staging directory, if any.
+
+    Returns:
+        Dict: The index entry of the published model.
+
+    Raises:
+        FileNotFoundError: If the staging directory does not exist.
+    """
+    logger = logging.getLogger(__name__)
+    if not os.path.isdir(staging_dir):
+        logger.error(f"Staging directory {staging_dir} does not exist.")
+        raise FileNotFoundError(f"Staging directory {staging_dir} does not exist.")
+
+    os.makedirs(model_dir, exist_ok=True)
+    if os.stat(staging_dir).st_dev != os.stat(model_dir).st_dev:
+        # rename() cannot cross filesystems; copy next to the index first.
+        local_staging = create_staging_dir(model_dir)
+        shutil.copytree(staging_dir, local_staging, dirs_exist_ok=True)
+        staging_dir = local_staging
+
+    if metrics is None:
+        metrics_path = os.path.join(staging_dir, "training_metrics.json")
+        if os.path.exists(metrics_path):
+            with open(metrics_path, 'r') as f:
+                metrics = json.load(f)
+    sha256 = compute_model_hash(staging_dir)
+
+    with _index_lock(model_dir):
+        index = load_index(model_dir)
+        version = 1 + max((entry['version'] for entry in index['models'] if entry['use_case'] == use_case), default=0)
+        relative_path = os.path.join(_use_case_dirname(use_case), f"v{version}")
+        os.makedirs(os.path.join(model_dir, _use_case_dirname(use_case)), exist_ok=True)
+        os.rename(staging_dir, os.path.join(model_dir, relative_path))
+
+        entry = {
+            "use_case": use_case,
+            "version": version,
+            "path": relative_path,
+            "sha256": sha256,
+            "metrics": metrics or {},
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        index['models'].append(entry)
+        _write_index(model_dir, index)
+
+    logger.info(f"Published {use_case!r} version {version} to {relative_path}")
+    return entry
+
+def find_model(index: Dict, use_case: Optional[str] = None, version: Optional[int] = None) -> Optional[Dict]:
+    """
+    Finds an index entry by use case and version.
+
+    Args:
+        index (Dict): The manifest from `load_index`.
+        use_case (Optional[str]): Use case to look up. None matches every use case.
+        version (Optional[int]): Version to look up. None selects the latest version.
+
+    Returns:
+        Optional[Dict]: The matching entry, or None if there is none.
+    """
+    entries: List[Dict] = [
+        entry for entry in index['models']
+        if (use_case is None or entry['use_case'] == use_case)
+        and (version is None or entry['version'] == version)
+    ]
+    return entries[-1] if entries else None
+
+def resolve_model_path(model_dir: str, use_case: Optional[str] = None, version: Optional[int] = None) -> str:
+    """
+    Resolves a published model to its directory.
+
+    Args:
+        model_dir (str): Directory containing fine-tuned models.
+        use_case (Optional[str]): Use case to look up. None selects the most recently published model.
+        version (Optional[int]): Version to look up. None selects the latest version.
+
+    Returns:
+        str: Path to the model directory.
+
+    Raises:
+        FileNotFoundError: If no published model matches.
+    """
+    entry = find_model(load_index(model_dir), use_case, version)
+    if entry is None:
+        raise FileNotFoundError(f"No published model for use case {use_case!r} version {version!r} in {model_dir}.")
+    return os.path.join(model_dir, entry['path'])
@@ -0,0 +1,219 @@
+import os
+import logging
+from typing import Optional
+import numpy as np
+import torch
+from transformers import AutoConfig, GenerationConfig, TemperatureLogitsWarper, TopKLogitsWarper, TopPLogitsWarper
+
+ONNX_DIRNAME = "onnx"
+ONNX_MODEL_FILENAME = "model.onnx"
+ONNX_INT8_MODEL_FILENAME = "model.int8.onnx"
+
+def kv_cache_names(num_layers: int, prefix: str):
+    return [f"{prefix}.{layer}.{kind}" for layer in range(num_layers) for kind in ("key", "value")]
+
+def onnx_model_bytes(onnx_path: str) -> int:
+    """
+    Returns the size of an ONNX model in bytes: the graph file plus the external-data files
+    its weights are stored in when the model is over protobuf's 2 GB limit.
+    """
+    import onnx
+    from onnx.external_data_helper import ExternalDataInfo, uses_external_data
+    model = onnx.load(onnx_path, load_external_data=False)
+    locations = {ExternalDataInfo(tensor).location for tensor in model.graph.initializer if uses_external_data(tensor)}
+    base_dir = os.path.dirname(onnx_path)
+    return os.path.getsize(onnx_path) + sum(os.path.getsize(os.path.join(base_dir, location)) for location in locations)
+
+def _banned_ngram_tokens(tokens: list, ngram_size: int) -> list:
+    """
+    Returns the tokens that would repeat an n-gram of `tokens`, matching
+    transformers' NoRepeatNGramLogitsProcessor.
+    """
+    if ngram_size <= 0 or len(tokens) + 1 < ngram_size:
+        return []
+    prefix = tuple(tokens[len(tokens) - ngram_size + 1:])
+    banned = []
+    for start in range(len(tokens) - ngram_size + 1):
+        if tuple(tokens[start:start + ngram_size - 1]) == prefix:
+            banned.append(tokens[start + ngram_size - 1])
+    return banned
+
+class OnnxCausalLM:
+    """
+    Greedy or sampled decoding of an exported causal LM on ONNX Runtime (CPU).
+
+    Mirrors the subset of `model.generate` used by `ModelServer` and returns token ids as a
+    torch tensor, so it can stand in for the PyTorch model. Sampling settings default to the
+    saved generation config, as they do for the PyTorch model. The KV cache is carried between
+    steps, so every step after the prompt feeds a single token.
+    """
+    def __init__(self, model_path: str, int8: bool = False, num_threads: Optional[int] = None):
+        """
+        Args:
+            model_path (str): Directory of the saved model, containing the `onnx` export.
+            int8 (bool): Use the int8-quantized export. Defaults to False.
+            num_threads (Optional[int]): Intra-op threads. Defaults to ONNX Runtime's choice.
+
+        Raises:
+            FileNotFoundError: If the model has not been exported to ONNX.
+        """
+        self.logger = logging.getLogger(__name__)
+        filename = ONNX_INT8_MODEL_FILENAME if int8 else ONNX_MODEL_FILENAME
+        self.onnx_path = os.path.join(model_path, ONNX_DIRNAME, filename)
+        if not os.path.exists(self.onnx_path):
+            self.logger.error(f"ONNX model {self.onnx_path} does not exist.")
+            raise FileNotFoundError(f"ONNX model {self.onnx_path} does not exist. Export it with finetuning.export.export_onnx.")
+
+        self.config = AutoConfig.from_pretrained(model_path)
+        # Like from_pretrained, prefer the saved generation defaults, which may list several EOS ids.
+        if os.path.exists(os.path.join(model_path, "generation_config.json")):
+            self.generation_config = GenerationConfig.from_pretrained(model_path)
+        else:
+            self.generation_config = GenerationConfig.from_model_config(self.config)
+        self.nbytes = onnx_model_bytes(self.onnx_path)
+        self.num_threads = num_threads
+        self.num_layers = self.config.num_hidden_layers
+        self.num_kv_heads = getattr(self.config, "num_key_value_heads", self.config.num_attention_heads)
+        self.head_dim = getattr(self.config, "head_dim", None) or self.config.hidden_size // self.config.num_attention_heads
+        self.past_names = kv_cache_names(self.num_layers, "past_key_values")
+        self.present_names = kv_cache_names(self.num_layers, "present")
+        self._session = None
+        self._session_pid = None
+        self._get_session()
+
+    def _get_session(self):
+        # ONNX Runtime thread pools do not survive fork(); forked workers open their own session.
+        if self._session is None or self._session_pid != os.getpid():
+            import onnxruntime as ort
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if self.num_threads:
+                options.intra_op_num_threads = self.num_threads
+            self._session = ort.InferenceSession(self.onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+            self._session_pid = os.getpid()
+            self.logger.info(f"Opened ONNX Runtime session for {self.onnx_path}")
+        return self._session
+
+    def eval(self):
+        return self
+
+    def generate(self, input_ids, attention_mask=None, max_length: int = 20, max_new_tokens: Optional[int] = None,
+                 num_return_sequences: int = 1, no_repeat_ngram_size: int = 0,
+                 eos_token_id=None, pad_token_id: Optional[int] = None,
+                 do_sample: Optional[bool] = None, temperature: Optional[float] = None,
+                 top_k: Optional[int] = None, top_p: Optional[float] = None,
+                 early_stopping: Optional[bool] = None, logits_processor=None) -> torch.Tensor:
+        """
+        Generates continuations of `input_ids`, greedily or by sampling.
+
+        Args:
+            input_ids: Prompt token ids of shape (batch, sequence).
+            attention_mask: Prompt attention mask. Defaults to all ones.
+            max_length (int): Maximum total length including the prompt.
+            max_new_tokens (Optional[int]): Maximum number of new tokens; overrides `max_length`.
+            num_return_sequences (int): Sequences per prompt. Greedy rows are identical, so they are repeated.
+            no_repeat_ngram_size (int): Forbid repeating n-grams of this size.
+            eos_token_id: Stop token id or list of ids. Defaults to the generation config's.
+            pad_token_id (Optional[int]): Token appended to finished rows. Defaults to the
+                generation config's, or else the first EOS token.
+            do_sample (Optional[bool]): Sample instead of decoding greedily. Defaults to the generation config's.
+            temperature (Optional[float]): Sampling temperature. Defaults to the generation config's.
+            top_k (Optional[int]): Sample from the k most likely tokens. Defaults to the generation config's.
+            top_p (Optional[float]): Nucleus sampling probability mass. Defaults to the generation config's.
+            early_stopping (Optional[bool]): Only affects beam search; accepted for compatibility.
+            logits_processor: Optional transformers `LogitsProcessor`s applied to every step's scores.
+
+        Returns:
+            torch.Tensor: Prompt plus generated token ids.
+
+        Raises:
+            ValueError: If the generation config asks for beam search.
+        """
+        generation_config = self.generation_config
+        if (generation_config.num_beams or 1) > 1:
+            self.logger.error("Beam search is not supported by the ONNX backend.")
+            raise ValueError("Beam search is not supported by the ONNX backend; set num_beams to 1.")
+        do_sample = generation_config.do_sample if do_sample is None else do_sample
+        warpers = []
+        if do_sample:
+            # The same warpers, in the same order, as transformers' sampling.
+            temperature = generation_config.temperature if temperature is None else temperature
+            top_k = generation_config.top_k if top_k is None else top_k
+            top_p = generation_config.top_p if top_p is None else top_p
+            if temperature is not None and temperature != 1.0:
+                warpers.append(TemperatureLogitsWarper(temperature))
+            if top_k is not None and top_k != 0:
+                warpers.append(TopKLogitsWarper(top_k=top_k, min_tokens_to_keep=1))
+            if top_p is not None and top_p < 1.0:
+                warpers.append(TopPLogitsWarper(top_p=top_p, min_tokens_to_keep=1))
+
+        tokens = np.asarray(input_ids, dtype=np.int64)
+        mask = np.ones_like(tokens) if attention_mask is None else np.asarray(attention_mask, dtype=np.int64)
+        if do_sample and num_return_sequences > 1:
+            # Sampled rows differ, so each one is decoded, as transformers does.
+            tokens = np.repeat(tokens, num_return_sequences, axis=0)
+            mask = np.repeat(mask, num_return_sequences, axis=0)
+            num_return_sequences = 1
+        if max_new_tokens is not None:
+            max_length = tokens.shape[1] + max_new_tokens
+        if eos_token_id is None:
+            eos_token_id = self.generation_config.eos_token_id
+        eos_token_ids = [] if eos_token_id is None else [eos_token_id] if isinstance(eos_token_id, int) else list(eos_token_id)
+        if pad_token_id is None:
+            pad_token_id = self.generation_config.pad_token_id
+        if pad_token_id is None:
+            # Only finished rows are padded, and rows can only finish on an EOS token.
+            pad_token_id = eos_token_ids[0] if eos_token_ids else 0
+
+        batch_size = tokens.shape[0]
+        past = {
+            name: np.zeros((batch_size, self.num_kv_heads, 0, self.head_dim), dtype=np.float32)
+            for name in self.past_names
+        }
+        finished = np.zeros(batch_size, dtype=bool)
+        step_ids = tokens
+        position_ids = np.clip(np.cumsum(mask, axis=1) - 1, 0, None)
+        session = self._get_session()
+
+        while tokens.shape[1] < max_length:
+            outputs = session.run(None, {
+                "input_ids": step_ids,
+                "attention_mask": mask,
+                "position_ids": position_ids,
+                **past,
+            })
+            logits = outputs[0][:, -1, :]
+            past = dict(zip(self.past_names, outputs[1:]))
+            if logits_processor:
+                scores = torch.from_numpy(logits)
+                for processor in logits_processor:
+                    scores = processor(torch.from_numpy(tokens), scores)
+                logits = scores.numpy()
+
+            for row in range(batch_size):
+                banned = _banned_ngram_tokens(tokens[row].tolist(), no_repeat_ngram_size)
+                if banned:
+                    logits[row, banned] = -np.inf
+            if do_sample:
+                scores = torch.from_numpy(logits)
+                for warper in warpers:
+                    scores = warper(torch.from_numpy(tokens), scores)
+                probs = torch.nn.functional.softmax(scores, dim=-1)
+                next_tokens = torch.multinomial(probs, num_samples=1).squeeze(1).numpy()
+            else:
+                next_tokens = logits.argmax(axis=-1)
+            next_tokens = np.where(finished, pad_token_id, next_tokens)
+
+            tokens = np.concatenate([tokens, next_tokens[:, None]], axis=1)
+            mask = np.concatenate([mask, np.ones((batch_size, 1), dtype=np.int64)], axis=1)
+            step_ids = next_tokens[:, None]
+            position_ids = position_ids[:, -1:] + 1
+
+            if eos_token_ids:
+                finished |= np.isin(next_tokens, eos_token_ids)
+                if finished.all():
+                    break
+
+        if num_return_sequences > 1:
+            tokens = np.repeat(tokens, num_return_sequences, axis=0)
+        return torch.from_numpy(tokens)
@@ -0,0 +1,461 @@
+import gc
+import os
+import signal
+import logging
+import itertools
+import threading
+import multiprocessing
+from multiprocessing import reduction
+from multiprocessing.connection import Connection, wait
+from concurrent.futures import Future
+from typing import List, Optional
+import torch
+from .serve_model import ModelServer
+from .utils import get_private_bytes
+from .metrics import record_prediction
+
+def _worker_loop(conn, threads_per_worker: int, server_kwargs: dict) -> None:
+    """
+    Inference worker entry point. Runs in a forked child and serves requests from `conn`
+    until it receives None or the parent goes away.
+    """
+    # The parent owns shutdown; a terminal Ctrl-C must not kill workers mid-request.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    torch.set_num_threads(threads_per_worker)
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        request_id, action, model_path, args = message
+        try:
+            if action == "predict":
+                prompt, kwargs = args
+                result = ModelServer(model_path, **server_kwargs).generate_with_timings(prompt, **kwargs)
+            elif action == "evict":
+                ModelServer.evict(model_path)
+                result = None
+            else:
+                raise ValueError(f"Unknown action {action!r}.")
+            conn.send((request_id, True, result))
+        except Exception as e:
+            conn.send((request_id, False, str(e)))
+
+def _template_loop(conn, threads_per_worker: int, server_kwargs: dict) -> None:
+    """
+    Template process entry point. Holds the loaded models and forks inference workers
+    on request, so workers are never forked from the multi-threaded serving process.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Workers are not waited on by this process; let the kernel reap them.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    torch.set_num_threads(threads_per_worker)
+    # This process holds the models itself, whatever pool the serving process reports on.
+    ModelServer._resident_stats_provider = None
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        action, model_path = message
+        try:
+            if action == "fork":
+                fd = reduction.recv_handle(conn)
+                pid = os.fork()
+                if pid == 0:
+                    try:
+                        conn.close()
+                        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                        _worker_loop(Connection(fd), threads_per_worker, server_kwargs)
+                    finally:
+                        os._exit(0)
+                os.close(fd)
+                result = pid
+            elif action == "load":
+                ModelServer(model_path, **server_kwargs)
+                result = ModelServer.resident_stats()
+            elif action == "evict":
+                ModelServer.evict(model_path)
+                result = ModelServer.resident_stats()
+            elif action == "stats":
+                result = ModelServer.resident_stats()
+            else:
+                raise ValueError(f"Unknown action {action!r}.")
+            conn.send((True, result))
+        except Exception as e:
+            conn.send((False, str(e)))
+
+class _Worker:
+    """Parent-side handle of one inference worker."""
+    def __init__(self, pid: int, conn):
+        self.pid = pid
+        self.conn = conn
+        self.in_flight = 0
+        self.retired = False
+        # Serializes writes to `conn` without holding the pool's lock while a send blocks.
+        self.send_lock = threading.Lock()
+
+class PreforkModelServer:
+    """
+    Serves predictions from a pool of forked inference workers that share the parent's model weights.
+
+    Models are loaded once in the parent through `ModelServer`, then a template process is
+    forked while the parent is still single-threaded, and the template forks `num_workers`
+    workers. Weight pages are never written during inference, so workers share them
+    copy-on-write (and, for memory-mapped safetensors, through the page cache). Crashed
+    workers are replaced with new forks of the template, never of the serving process, and
+    models loaded later are loaded in the template and rolled out by replacing the workers.
+    Requests are dispatched to the worker with the fewest requests in flight. Workers send
+    their latency breakdown back with each prediction, and it is recorded in this process's metrics,
+    as are the template's resident model count and bytes while the pool is running.
+    """
+    def __init__(self, model_paths: List[str], num_workers: int, threads_per_worker: int = 1, **server_kwargs):
+        """
+        Loads the models and forks the workers.
+
+        Args:
+            model_paths (List[str]): Models to load in the parent before forking. Models requested
+                later are loaded by each worker on first use.
+            num_workers (int): Number of inference worker processes.
+            threads_per_worker (int): Torch intra-op threads per worker. Defaults to 1.
+            **server_kwargs: Keyword arguments passed to `ModelServer`.
+
+        Raises:
+            ValueError: If `num_workers` is less than 1, or the backend is "onnx".
+        """
+        self.logger = logging.getLogger(__name__)
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1.")
+        if server_kwargs.get('backend', "torch") != "torch":
+            # ONNX Runtime sessions do not survive fork(), so every worker would reopen the
+            # model and hold a private copy of the weights instead of sharing them.
+            self.logger.error("Pre-forked workers only support the torch backend.")
+            raise ValueError("Pre-forked workers only support the torch backend; set deployment.workers to 0 to serve with ONNX Runtime.")
+
+        self.threads_per_worker = threads_per_worker
+        self.server_kwargs = server_kwargs
+        self.log_sample_rate = server_kwargs.get('log_sample_rate', 0.0)
+        for model_path in model_paths:
+            ModelServer(model_path, **server_kwargs)
+
+        self._context = multiprocessing.get_context('fork')
+        self._lock = threading.Lock()
+        self._template_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._pending = {}
+        self._workers: List[Optional[_Worker]] = [None] * num_workers
+        self._retiring: List[_Worker] = []
+        self._closed = False
+        # Written to whenever the set of workers changes, so the collector starts watching new ones at once.
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_write, False)
+
+        # Tokenizers disable their thread pool after a fork anyway; say so up front instead of warning per worker.
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+        # Move everything allocated so far out of the collector's reach so that
+        # collections in the workers do not touch (and copy) the shared pages.
+        gc.freeze()
+        self._template_conn, child_conn = self._context.Pipe()
+        self._template = self._context.Process(
+            target=_template_loop,
+            args=(child_conn, threads_per_worker, server_kwargs),
+            name="inference-template",
+            daemon=True,
+        )
+        self._template.start()
+        child_conn.close()
+
+        for index in range(num_workers):
+            self._workers[index] = self._fork_worker()
+        # Cached so scraping metrics never waits on the template; refreshed after every load and evict.
+        self._resident_stats = self._call_template("stats")
+        ModelServer._resident_stats_provider = self.resident_stats
+
+        self._collector = threading.Thread(target=self._collect_results, name="prefork-collector", daemon=True)
+        self._collector.start()
+        self.logger.info(f"Started {num_workers} inference workers with {len(model_paths)} preloaded model(s).")
+
+    def _call_template(self, action: str, model_path: Optional[str] = None, fd: Optional[int] = None):
+        with self._template_lock:
+            self._template_conn.send((action, model_path))
+            if fd is not None:
+                reduction.send_handle(self._template_conn, fd, self._template.pid)
+            ok, payload = self._template_conn.recv()
+        if not ok:
+            raise RuntimeError(payload)
+        return payload
+
+    def _fork_worker(self) -> _Worker:
+        parent_conn, child_conn = self._context.Pipe()
+        try:
+            pid = self._call_template("fork", fd=child_conn.fileno())
+        finally:
+            child_conn.close()
+        return _Worker(pid, parent_conn)
+
+    def submit(self, model_path: str, prompt: str, **kwargs) -> Future:
+        """
+        Sends a prediction request to the least busy worker.
+
+        Args:
+            model_path (str): Path to the model to use.
+            prompt (str): The input text prompt.
+            **kwargs: Keyword arguments passed to `ModelServer.predict`.
+
+        Returns:
+            Future: Resolves to the prediction, or raises RuntimeError if the request failed.
+
+        Raises:
+            RuntimeError: If the pool has been shut down or no worker is available.
+        """
+        while True:
+            with self._lock:
+                workers = [worker for worker in self._workers if worker is not None and not worker.retired]
+                if not workers:
+                    raise RuntimeError("No inference worker is available.")
+                worker = min(workers, key=lambda w: w.in_flight)
+            future = self._send(worker, "predict", model_path, (prompt, kwargs))
+            if future is not None:
+                return future
+
+    def predict(self, model_path: str, prompt: str, **kwargs) -> str:
+        """
+        Generates a prediction on a worker and waits for the result.
+        """
+        return self.submit(model_path, prompt, **kwargs).result()
+
+    def load_model(self, model_path: str) -> None:
+        """
+        Loads (and, if configured, warms up) a model and rolls it out to every worker.
+
+        The model is loaded in the template process while the workers keep serving. Each
+        worker is then replaced, one at a time, by a new fork of the template that shares
+        the loaded weights; the old worker finishes the requests already sent to it and exits.
+        """
+        self._resident_stats = self._call_template("load", model_path)
+        for index in range(len(self._workers)):
+            self._replace_worker(index)
+
+    def evict_model(self, model_path: str) -> None:
+        """
+        Drops a model from every worker's cache, the template's and this process's, and waits until all are done.
+        """
+        self._broadcast("evict", model_path)
+        self._resident_stats = self._call_template("evict", model_path)
+        ModelServer.evict(model_path)
+
+    def _broadcast(self, action: str, model_path: str) -> None:
+        with self._lock:
+            workers = [worker for worker in self._workers if worker is not None]
+        futures = [self._send(worker, action, model_path) for worker in workers]
+        for future in futures:
+            if future is not None:
+                future.result()
+
+    def _send(self, worker: _Worker, action: str, model_path: str, args=None) -> Optional[Future]:
+        # Returns None if the worker was retired before the request could be sent.
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("PreforkModelServer has been shut down.")
+            request_id = next(self._request_ids)
+            self._pending[request_id] = (worker, future, action, model_path)
+            worker.in_flight += 1
+
+        try:
+            with worker.send_lock:
+                if worker.retired:
+                    error = None
+                else:
+                    worker.conn.send((request_id, action, model_path, args))
+                    return future
+        except (OSError, ValueError) as e:
+            error = RuntimeError(f"Could not send the request to inference worker {worker.pid}: {str(e)}")
+
+        with self._lock:
+            if self._pending.pop(request_id, None) is None:
+                # The worker exited and the request has already been failed.
+                return future
+            worker.in_flight -= 1
+        if error is None:
+            return None
+        future.set_exception(error)
+        return future
+
+    def _replace_worker(self, index: int) -> None:
+        worker = self._fork_worker()
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                old = self._workers[index]
+                self._workers[index] = worker
+                if old is not None:
+                    self._retiring.append(old)
+        if closed:
+            self._retire(worker)
+            worker.conn.close()
+            return
+        self._wake_collector()
+        if old is not None:
+            self._retire(old)
+
+    def _wake_collector(self) -> None:
+        try:
+            os.write(self._wakeup_write, b"\0")
+        except BlockingIOError:
+            pass
+
+    def _retire(self, worker: _Worker) -> None:
+        # The worker finishes the requests already sent to it, then exits.
+        with worker.send_lock:
+            worker.retired = True
+            try:
+                worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+
+    def _collect_results(self) -> None:
+        while not self._closed:
+            with self._lock:
+                connections = {worker.conn: worker for worker in self._workers + self._retiring if worker is not None}
+
+            for ready in wait(list(connections) + [self._wakeup_read], timeout=1.0):
+                if ready == self._wakeup_read:
+                    os.read(self._wakeup_read, 4096)
+                    continue
+                worker = connections[ready]
+                try:
+                    request_id, ok, payload = ready.recv()
+                except (EOFError, OSError):
+                    self._handle_worker_exit(worker)
+                    continue
+                with self._lock:
+                    entry = self._pending.pop(request_id, None)
+                    if entry is not None:
+                        worker.in_flight -= 1
+                if entry is None:
+                    continue
+                _, future, action, model_path = entry
+                if not ok:
+                    future.set_exception(RuntimeError(payload))
+                elif action == "predict":
+                    prediction, timings = payload
+                    record_prediction(timings, model_path, self.log_sample_rate)
+                    future.set_result(prediction)
+                else:
+                    future.set_result(payload)
+
+    def _handle_worker_exit(self, worker: _Worker) -> None:
+        with self._lock:
+            failed = [request_id for request_id, (owner, *_) in self._pending.items() if owner is worker]
+            futures = [self._pending.pop(request_id)[1] for request_id in failed]
+            worker.in_flight = 0
+            if worker in self._retiring:
+                self._retiring.remove(worker)
+                index = None
+            else:
+                index = self._workers.index(worker)
+                self._workers[index] = None
+            closed = self._closed
+        worker.conn.close()
+
+        if index is not None and not closed:
+            self.logger.error(f"Inference worker {worker.pid} exited unexpectedly; restarting.")
+            # Forking goes through the template, which may be busy loading a model; keep collecting meanwhile.
+            threading.Thread(target=self._restart_worker, args=(index,), name=f"prefork-restart-{index}", daemon=True).start()
+        for future in futures:
+            future.set_exception(RuntimeError(f"Inference worker {worker.pid} exited before completing the request."))
+
+    def _restart_worker(self, index: int) -> None:
+        try:
+            worker = self._fork_worker()
+        except Exception as e:
+            self.logger.error(f"Failed to restart inference worker {index}: {str(e)}")
+            return
+        with self._lock:
+            if not self._closed and self._workers[index] is None:
+                self._workers[index] = worker
+                installed = True
+            else:
+                installed = False
+        if installed:
+            self._wake_collector()
+            return
+        self._retire(worker)
+        worker.conn.close()
+
+    def resident_stats(self) -> dict:
+        """
+        Returns the number of models resident in the template process, and so shared by every
+        worker, and the size of their weights in bytes.
+        """
+        return dict(self._resident_stats)
+
+    def stats(self) -> List[dict]:
+        """
+        Returns the pid, requests in flight and private (unshared) memory of each worker.
+        A worker that is being restarted has a pid of None.
+        """
+        with self._lock:
+            workers = list(self._workers)
+        return [
+            {
+                "pid": worker.pid if worker else None,
+                "in_flight": worker.in_flight if worker else 0,
+                "private_bytes": get_private_bytes(worker.pid) if worker else None,
+            }
+            for worker in workers
+        ]
+
+    def shutdown(self, timeout: Optional[float] = 5.0) -> None:
+        """
+        Stops the workers and the template process, failing any requests still in flight.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = [worker for worker in self._workers if worker is not None] + self._retiring
+        if ModelServer._resident_stats_provider == self.resident_stats:
+            ModelServer._resident_stats_provider = None
+        for worker in workers:
+            self._retire(worker)
+        self._wake_collector()
+        self._collector.join()
+
+        # Workers are children of the template, so wait for their end of the pipe to close.
+        for worker in workers:
+            try:
+                while worker.conn.poll(timeout):
+                    worker.conn.recv()
+                os.kill(worker.pid, signal.SIGTERM)
+            except (EOFError, OSError):
+                pass
+
+        with self._template_lock:
+            try:
+                self._template_conn.send(None)
+            except OSError:
+                pass
+        self._template.join(timeout)
+        if self._template.is_alive():
+            self._template.terminate()
+            self._template.join()
+
+        for _, future, *_ in self._pending.values():
+            future.set_exception(RuntimeError("PreforkModelServer has been shut down."))
+        self._pending.clear()
+        for worker in workers:
+            worker.conn.close()
+        self._template_conn.close()
+        os.close(self._wakeup_read)
+        os.close(self._wakeup_write)
+        self.logger.info("Inference workers stopped.")
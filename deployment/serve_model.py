@@ -1,8 +1,26 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer, AutoConfig, GenerationConfig, LogitsProcessor, LogitsProcessorList
+from transformers.modeling_utils import no_init_weights
+from accelerate import init_empty_weights
 import torch
 import logging
 import os
-from typing import Optional
+import time
+from typing import Optional, Tuple
+from .utils import load_safetensors_mmap, get_rss_bytes
+from .onnx_backend import OnnxCausalLM
+from .metrics import REGISTRY, Gauge, record_prediction
+
+class _FirstTokenTimer(LogitsProcessor):
+    """
+    Records when generation produces its first logits, which marks the end of the prefill pass.
+    """
+    def __init__(self):
+        self.first_token_time = None
+    
+    def __call__(self, input_ids, scores):
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+        return scores
 
 class ModelServer:
     """
@@ -10,20 +28,46 @@ class ModelServer:
     """
     _model_cache = {}
     _tokenizer_cache = {}
+    _startup_metrics = {}
+    # Set while a pre-forked pool serves the models from its own processes.
+    _resident_stats_provider = None
     
-    def __init__(self, model_path: str):
+    BACKENDS = ("torch", "onnx")
+    
+    def __init__(self, model_path: str, mmap_weights: bool = True, warmup: bool = False,
+                 warmup_prompt: str = "Hello", warmup_max_new_tokens: int = 4,
+                 backend: str = "torch", onnx_int8: bool = False, log_sample_rate: float = 0.0):
         """
         Initializes the ModelServer by loading the model and tokenizer.
         
         Args:
             model_path (str): Path to the fine-tuned model directory.
+            mmap_weights (bool): Memory-map safetensors weights instead of copying them. Defaults to True.
+            warmup (bool): Run a short generation after loading so the first request
+                does not pay one-time initialization costs. Defaults to False.
+            warmup_prompt (str): Prompt used for the warmup generation.
+            warmup_max_new_tokens (int): Number of tokens generated during warmup.
+            backend (str): Inference backend, "torch" or "onnx" (ONNX Runtime on CPU,
+                requires an export from `finetuning.export.export_onnx`). Defaults to "torch".
+            onnx_int8 (bool): Use the int8-quantized ONNX export. Defaults to False.
+            log_sample_rate (float): Fraction of predictions logged as structured summaries. Defaults to 0.
         
         Raises:
-            FileNotFoundError: If the model directory does not exist.
+            FileNotFoundError: If the model directory (or the ONNX export) does not exist.
+            ValueError: If the backend is unknown.
             Exception: If loading the model or tokenizer fails.
         """
         self.logger = logging.getLogger(__name__)
         self.model_path = model_path
+        self.mmap_weights = mmap_weights
+        self.backend = backend
+        self.onnx_int8 = onnx_int8
+        self.log_sample_rate = log_sample_rate
+        self.use_cuda = torch.cuda.is_available() and backend == "torch"
+        
+        if backend not in self.BACKENDS:
+            self.logger.error(f"Unknown backend {backend}.")
+            raise ValueError(f"Unknown backend {backend!r}; expected one of {self.BACKENDS}.")
         
         if not os.path.exists(model_path):
             self.logger.error(f"Model path {model_path} does not exist.")
@@ -33,31 +77,199 @@ class ModelServer:
             # Load tokenizer from cache or load and cache it
             if model_path in self._tokenizer_cache:
                 self.tokenizer = self._tokenizer_cache[model_path]
-                self.logger.info(f"Loaded tokenizer from cache for {model_path}.")
+                self.logger.debug(f"Loaded tokenizer from cache for {model_path}.")
             else:
                 self.tokenizer = AutoTokenizer.from_pretrained(model_path)
                 self._tokenizer_cache[model_path] = self.tokenizer
                 self.logger.info(f"Loaded and cached tokenizer for {model_path}.")
             
             # Load model from cache or load and cache it
-            if model_path in self._model_cache:
-                self.model = self._model_cache[model_path]
-                self.logger.info(f"Loaded model from cache for {model_path}.")
+            cache_key = self.cache_key(model_path, backend, onnx_int8)
+            self.model_cache_hit = cache_key in self._model_cache
+            if self.model_cache_hit:
+                self.model = self._model_cache[cache_key]
+                self.logger.debug(f"Loaded model from cache for {model_path}.")
             else:
-                self.model = AutoModelForCausalLM.from_pretrained(model_path)
+                rss_before = get_rss_bytes()
+                start = time.perf_counter()
+                self.model = self._load_model(model_path)
                 self.model.eval()
-                if torch.cuda.is_available():
+                if self.use_cuda:
                     self.model.to('cuda')
-                self._model_cache[model_path] = self.model
-                self.logger.info(f"Loaded and cached model for {model_path}.")
+                load_ms = (time.perf_counter() - start) * 1000
+                
+                first_token_ms = self._warmup(warmup_prompt, warmup_max_new_tokens) if warmup else None
+                
+                self._model_cache[cache_key] = self.model
+                self._startup_metrics[cache_key] = {
+                    "load_ms": load_ms,
+                    "first_token_ms": first_token_ms,
+                    "rss_bytes": get_rss_bytes(),
+                    "rss_delta_bytes": get_rss_bytes() - rss_before,
+                    "mmap_weights": self.mmap_weights,
+                    "backend": backend,
+                }
+                self.logger.info(f"Loaded and cached model for {model_path} in {load_ms:.1f} ms.")
         except Exception as e:
             self.logger.error(f"Failed to load model or tokenizer: {str(e)}")
             raise e
     
+    def _load_model(self, model_path: str):
+        """
+        Loads the model, memory-mapping safetensors weights when enabled.
+        
+        The mmap path builds the model skeleton without allocating or initializing
+        parameters and then assigns the mapped tensors directly, so load time no longer
+        scales with a copy of every weight. Models without safetensors weights fall back
+        to a regular `from_pretrained`.
+        """
+        if self.backend == "onnx":
+            self.mmap_weights = False
+            return OnnxCausalLM(model_path, int8=self.onnx_int8)
+        
+        state_dict = load_safetensors_mmap(model_path) if self.mmap_weights else None
+        if state_dict is None:
+            self.mmap_weights = False
+            return AutoModelForCausalLM.from_pretrained(model_path)
+        
+        config = AutoConfig.from_pretrained(model_path)
+        with init_empty_weights(include_buffers=False), no_init_weights():
+            model = AutoModelForCausalLM.from_config(config)
+        model.load_state_dict(state_dict, strict=False, assign=True)
+        model.tie_weights()
+        # from_config only derives generation defaults from the model config; keep the saved
+        # EOS ids and sampling settings that from_pretrained would load.
+        if os.path.exists(os.path.join(model_path, "generation_config.json")):
+            model.generation_config = GenerationConfig.from_pretrained(model_path)
+        
+        missing = [name for name, param in model.named_parameters() if param.is_meta]
+        if missing:
+            raise ValueError(f"Weights missing from {model_path}: {', '.join(missing)}")
+        return model
+    
+    def _warmup(self, prompt: str, max_new_tokens: int) -> float:
+        """
+        Runs warmup generations and returns the time to the first generated token in milliseconds.
+        """
+        inputs = self.tokenizer(prompt, return_tensors="pt")
+        if self.use_cuda:
+            inputs = {k: v.to('cuda') for k, v in inputs.items()}
+        
+        with torch.no_grad():
+            start = time.perf_counter()
+            self.model.generate(**inputs, max_new_tokens=1, pad_token_id=self.tokenizer.pad_token_id)
+            first_token_ms = (time.perf_counter() - start) * 1000
+            self.model.generate(**inputs, max_new_tokens=max_new_tokens, pad_token_id=self.tokenizer.pad_token_id)
+        
+        self.logger.info(f"Warmed up model for {self.model_path}; first token in {first_token_ms:.1f} ms.")
+        return first_token_ms
+    
+    @staticmethod
+    def cache_key(model_path: str, backend: str = "torch", onnx_int8: bool = False) -> str:
+        """
+        Returns the model cache key. PyTorch models are keyed by path alone.
+        """
+        if backend == "torch":
+            return model_path
+        return f"{model_path}#{backend}{'-int8' if onnx_int8 else ''}"
+    
+    @classmethod
+    def evict(cls, model_path: str) -> None:
+        """
+        Drops a model (for every backend) and its tokenizer from the caches so its memory can be released.
+        """
+        for key in [key for key in cls._model_cache if key == model_path or key.startswith(f"{model_path}#")]:
+            cls._model_cache.pop(key)
+            cls._startup_metrics.pop(key, None)
+        cls._tokenizer_cache.pop(model_path, None)
+        logging.getLogger(__name__).info(f"Evicted model {model_path} from cache.")
+    
+    @classmethod
+    def resident_model_bytes(cls) -> int:
+        """
+        Returns the size of the weights of every cached model in bytes.
+        """
+        total = 0
+        for model in list(cls._model_cache.values()):
+            if isinstance(model, OnnxCausalLM):
+                total += model.nbytes
+            else:
+                total += sum(param.numel() * param.element_size() for param in model.parameters())
+        return total
+    
+    @classmethod
+    def resident_stats(cls) -> dict:
+        """
+        Returns the number of resident models and the size of their weights in bytes. While a
+        pre-forked pool is serving, the models live in its template process and are shared by
+        its workers, so the pool's counts are reported instead of this process's.
+        """
+        if cls._resident_stats_provider is not None:
+            return cls._resident_stats_provider()
+        return {"models": len(cls._model_cache), "bytes": cls.resident_model_bytes()}
+    
+    @classmethod
+    def get_startup_metrics(cls) -> dict:
+        """
+        Returns the cold-start metrics (load ms, first-token ms, RSS) of every loaded model, keyed by path.
+        """
+        return dict(cls._startup_metrics)
+    
+    def generate_with_timings(self, prompt: str, max_length: int = 50, num_return_sequences: int = 1) -> Tuple[str, dict]:
+        """
+        Generates a prediction and measures where the time went.
+        
+        Args:
+            prompt (str): The input text prompt.
+            max_length (int): The maximum length of the generated sequence.
+            num_return_sequences (int): Number of sequences to generate.
+        
+        Returns:
+            Tuple[str, dict]: The prediction, and the tokenize/prefill/decode/total seconds,
+                token counts, batch size and whether the model came from the cache.
+        """
+        start = time.perf_counter()
+        inputs = self.tokenizer(prompt, return_tensors="pt")
+        if self.use_cuda:
+            inputs = {k: v.to('cuda') for k, v in inputs.items()}
+        tokenized = time.perf_counter()
+        
+        timer = _FirstTokenTimer()
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **inputs,
+                max_length=max_length,
+                num_return_sequences=num_return_sequences,
+                no_repeat_ngram_size=2,
+                early_stopping=True,
+                logits_processor=LogitsProcessorList([timer]),
+            )
+        generated = time.perf_counter()
+        
+        prediction = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+        end = time.perf_counter()
+        
+        first_token = timer.first_token_time or generated
+        prompt_tokens = inputs['input_ids'].shape[1]
+        timings = {
+            "tokenize_seconds": tokenized - start,
+            "prefill_seconds": first_token - tokenized,
+            "decode_seconds": generated - first_token,
+            "total_seconds": end - start,
+            "prompt_tokens": prompt_tokens,
+            "generated_tokens": outputs.shape[1] - prompt_tokens,
+            "batch_size": outputs.shape[0],
+            "model_cache_hit": self.model_cache_hit,
+        }
+        return prediction, timings
+    
     def predict(self, prompt: str, max_length: int = 50, num_return_sequences: int = 1) -> str:
         """
         Generates a prediction based on the input prompt.
         
+        Latency, token counts and cache use are recorded in the serving metrics, and a sample
+        of predictions is logged as structured summaries without the prompt or prediction text.
+        
         Args:
             prompt (str): The input text prompt.
             max_length (int): The maximum length of the generated sequence.
@@ -69,24 +281,20 @@ class ModelServer:
         Raises:
             Exception: If prediction fails.
         """
-        self.logger.info(f"Received prompt: {prompt}")
         try:
-            inputs = self.tokenizer(prompt, return_tensors="pt")
-            if torch.cuda.is_available():
-                inputs = {k: v.to('cuda') for k, v in inputs.items()}
-            
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_length=max_length,
-                    num_return_sequences=num_return_sequences,
-                    no_repeat_ngram_size=2,
-                    early_stopping=True
-                )
-            
-            prediction = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            self.logger.info(f"Generated prediction: {prediction}")
-            return prediction
+            prediction, timings = self.generate_with_timings(prompt, max_length, num_return_sequences)
         except Exception as e:
-            self.logger.error(f"Prediction failed: {str(e)}")
+            self.logger.error(f"Prediction failed for {self.model_path}: {str(e)}")
             raise e
+        
+        record_prediction(timings, self.model_path, self.log_sample_rate)
+        return prediction
+
+RESIDENT_MODELS = REGISTRY.register(Gauge(
+    "llm_resident_models", "Models loaded for serving.",
+    function=lambda: ModelServer.resident_stats()["models"],
+))
+RESIDENT_MODEL_BYTES = REGISTRY.register(Gauge(
+    "llm_resident_model_bytes", "Size of the weights of the models loaded for serving.",
+    function=lambda: ModelServer.resident_stats()["bytes"],
+))
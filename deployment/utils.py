@@ -1,9 +1,19 @@
 import os
+import sys
+import mmap
+import json
+import struct
 import logging
+import torch
+from typing import Dict, List, Optional
+from .model_index import load_index, find_model
 
 def get_latest_model_path(model_dir: str) -> str:
     """
-    Retrieves the path to the latest fine-tuned model based on modification time.
+    Retrieves the path to the latest fine-tuned model.
+    
+    Uses the most recently published model in the model index when there is one, and
+    otherwise falls back to the most recently modified model directory.
     
     Args:
         model_dir (str): Directory containing fine-tuned models.
@@ -19,7 +29,17 @@ def get_latest_model_path(model_dir: str) -> str:
         logger.error(f"Model directory {model_dir} does not exist.")
         raise FileNotFoundError(f"Model directory {model_dir} does not exist.")
     
-    subdirs = [os.path.join(model_dir, d) for d in os.listdir(model_dir) if os.path.isdir(os.path.join(model_dir, d))]
+    entry = find_model(load_index(model_dir))
+    if entry is not None:
+        latest_dir = os.path.join(model_dir, entry['path'])
+        logger.info(f"Latest published model: {latest_dir} ({entry['use_case']} v{entry['version']})")
+        return latest_dir
+    
+    # Hidden directories hold models that are still being written.
+    subdirs = [
+        os.path.join(model_dir, d) for d in os.listdir(model_dir)
+        if not d.startswith('.') and os.path.isdir(os.path.join(model_dir, d))
+    ]
     if not subdirs:
         logger.error(f"No fine-tuned models found in {model_dir}.")
         raise FileNotFoundError(f"No fine-tuned models found in {model_dir}.")
@@ -27,3 +47,115 @@ def get_latest_model_path(model_dir: str) -> str:
     latest_dir = max(subdirs, key=os.path.getmtime)
     logger.info(f"Latest model directory: {latest_dir}")
     return latest_dir
+
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+def get_safetensors_files(model_path: str) -> List[str]:
+    """
+    Lists the safetensors weight files of a saved model, including sharded checkpoints.
+    
+    Args:
+        model_path (str): Path to the model directory.
+    
+    Returns:
+        List[str]: Paths of the weight files, or an empty list if the model is not saved as safetensors.
+    """
+    index_path = os.path.join(model_path, "model.safetensors.index.json")
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as f:
+            weight_map = json.load(f)['weight_map']
+        return [os.path.join(model_path, name) for name in sorted(set(weight_map.values()))]
+    
+    single_path = os.path.join(model_path, "model.safetensors")
+    if os.path.exists(single_path):
+        return [single_path]
+    return []
+
+def load_safetensors_mmap(model_path: str) -> Optional[Dict[str, torch.Tensor]]:
+    """
+    Loads a safetensors checkpoint as tensors that point directly into memory-mapped files.
+    
+    The files are mapped copy-on-write, so no weight bytes are copied at load time and
+    pages are only read from disk (or the page cache) when first touched. Processes that
+    map the same file share those pages.
+    
+    Args:
+        model_path (str): Path to the model directory.
+    
+    Returns:
+        Optional[Dict[str, torch.Tensor]]: The state dict, or None if the model has no safetensors weights.
+    """
+    logger = logging.getLogger(__name__)
+    files = get_safetensors_files(model_path)
+    if not files:
+        logger.info(f"No safetensors weights found in {model_path}.")
+        return None
+    
+    state_dict = {}
+    for path in files:
+        with open(path, 'rb') as f:
+            header_size = struct.unpack('<Q', f.read(8))[0]
+            header = json.loads(f.read(header_size))
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        
+        data_start = 8 + header_size
+        for name, info in header.items():
+            if name == "__metadata__":
+                continue
+            dtype = SAFETENSORS_DTYPES[info['dtype']]
+            begin, end = info['data_offsets']
+            count = (end - begin) // torch.empty((), dtype=dtype).element_size()
+            if count == 0:
+                state_dict[name] = torch.empty(info['shape'], dtype=dtype)
+                continue
+            tensor = torch.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + begin)
+            state_dict[name] = tensor.view(info['shape'])
+    
+    logger.info(f"Memory-mapped {len(state_dict)} tensors from {len(files)} safetensors file(s) in {model_path}.")
+    return state_dict
+
+def get_rss_bytes() -> int:
+    """
+    Returns the resident set size of the current process in bytes.
+    
+    Falls back to the peak RSS on platforms without /proc.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+def get_private_bytes(pid: int) -> Optional[int]:
+    """
+    Returns the memory private to a process (not shared with any other process) in bytes.
+    
+    Args:
+        pid (int): Process id.
+    
+    Returns:
+        Optional[int]: Private clean plus private dirty bytes, or None where /proc is unavailable.
+    """
+    try:
+        private = 0
+        with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+            for line in f:
+                if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                    private += int(line.split()[1]) * 1024
+        return private
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,105 @@
+import os
+import logging
+import torch
+from transformers import AutoModelForCausalLM
+from transformers.cache_utils import DynamicCache
+from deployment.onnx_backend import ONNX_DIRNAME, ONNX_MODEL_FILENAME, ONNX_INT8_MODEL_FILENAME, kv_cache_names
+
+class _KVCacheWrapper(torch.nn.Module):
+    """
+    Exposes a causal LM with the KV cache flattened into plain tensor inputs and outputs,
+    ordered `past_key_values.<layer>.key`, `past_key_values.<layer>.value`, ...
+    """
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        self.num_layers = model.config.num_hidden_layers
+
+    def forward(self, input_ids, attention_mask, position_ids, *past):
+        cache = DynamicCache.from_legacy_cache(tuple((past[2 * i], past[2 * i + 1]) for i in range(self.num_layers)))
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=cache,
+            use_cache=True,
+        )
+        present = outputs.past_key_values.to_legacy_cache()
+        return (outputs.logits,) + tuple(tensor for layer in present for tensor in layer)
+
+def export_onnx(model_path: str, quantize_int8: bool = False, opset_version: int = 17) -> str:
+    """
+    Exports a saved causal LM to ONNX with KV-cache inputs and outputs.
+
+    The graph takes `input_ids`, `attention_mask`, `position_ids` and the past keys/values
+    of every layer, and returns `logits` and the present keys/values, so a decode loop can
+    feed one token per step. Past inputs may have a sequence length of zero for the first step.
+
+    Args:
+        model_path (str): Directory of the saved model. The ONNX files are written to `<model_path>/onnx`.
+        quantize_int8 (bool): Also write a copy with dynamically quantized int8 weights. Defaults to False.
+        opset_version (int): ONNX opset to export with. Defaults to 17.
+
+    Returns:
+        str: Path to the exported fp32 ONNX model.
+
+    Raises:
+        Exception: If the export fails.
+    """
+    logger = logging.getLogger(__name__)
+
+    onnx_dir = os.path.join(model_path, ONNX_DIRNAME)
+    os.makedirs(onnx_dir, exist_ok=True)
+    onnx_path = os.path.join(onnx_dir, ONNX_MODEL_FILENAME)
+
+    # Eager attention traces to plain matmuls that ONNX Runtime fuses well.
+    model = AutoModelForCausalLM.from_pretrained(model_path, attn_implementation="eager", torch_dtype=torch.float32)
+    model.eval()
+    config = model.config
+    num_layers = config.num_hidden_layers
+    head_dim = getattr(config, "head_dim", None) or config.hidden_size // config.num_attention_heads
+    num_kv_heads = getattr(config, "num_key_value_heads", config.num_attention_heads)
+
+    past_names = kv_cache_names(num_layers, "past_key_values")
+    present_names = kv_cache_names(num_layers, "present")
+    dynamic_axes = {
+        "input_ids": {0: "batch", 1: "sequence"},
+        "attention_mask": {0: "batch", 1: "total_sequence"},
+        "position_ids": {0: "batch", 1: "sequence"},
+        "logits": {0: "batch", 1: "sequence"},
+    }
+    dynamic_axes.update({name: {0: "batch", 2: "past_sequence"} for name in past_names})
+    dynamic_axes.update({name: {0: "batch", 2: "total_sequence"} for name in present_names})
+
+    # Trace with a non-empty past so the cache concatenation is recorded with dynamic lengths.
+    past_length, sequence_length = 2, 3
+    dummy_past = [torch.zeros(1, num_kv_heads, past_length, head_dim) for _ in past_names]
+    dummy_inputs = (
+        torch.ones(1, sequence_length, dtype=torch.long),
+        torch.ones(1, past_length + sequence_length, dtype=torch.long),
+        torch.arange(past_length, past_length + sequence_length).unsqueeze(0),
+        *dummy_past,
+    )
+
+    logger.info(f"Exporting {model_path} to ONNX...")
+    with torch.no_grad():
+        torch.onnx.export(
+            _KVCacheWrapper(model),
+            dummy_inputs,
+            onnx_path,
+            input_names=["input_ids", "attention_mask", "position_ids"] + past_names,
+            output_names=["logits"] + present_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=opset_version,
+            dynamo=False,
+        )
+    logger.info(f"ONNX model saved to {onnx_path}")
+
+    if quantize_int8:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8_path = os.path.join(onnx_dir, ONNX_INT8_MODEL_FILENAME)
+        # Exports of models over 2 GB keep their weights in external-data files; so does the quantized model.
+        quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8, use_external_data_format=True)
+        logger.info(f"Int8 ONNX model saved to {int8_path}")
+
+    return onnx_path
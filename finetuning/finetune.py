@@ -3,6 +3,7 @@ import yaml
 import logging
 from transformers import AutoModelForCausalLM, Trainer, TrainingArguments, AutoTokenizer
 from .trainer import prepare_trainer
+from .export import export_onnx
 from .utils import preprocess_data, save_training_metrics
 from typing import List, Dict
 
@@ -49,6 +50,7 @@ def finetune_model(raw_data: List[Dict[str, str]], output_dir: str, use_case: st
             metric_for_best_model=config['training'].get('metric_for_best_model', None),
             greater_is_better=config['training'].get('greater_is_better', None),
             seed=config['training'].get('seed', 42),
+            save_safetensors=True,
         )
         
         # Prepare trainer
@@ -62,6 +64,10 @@ def finetune_model(raw_data: List[Dict[str, str]], output_dir: str, use_case: st
         tokenizer.save_pretrained(output_dir)
         logger.info(f"Model saved to {output_dir}")
         
+        # Export to ONNX for the ONNX Runtime serving backend
+        if config['training'].get('export_onnx', False):
+            export_onnx(output_dir, quantize_int8=config['training'].get('onnx_int8', False))
+        
         # Save training metrics
         if 'metrics' in training_output:
             save_training_metrics(training_output.metrics, output_dir)
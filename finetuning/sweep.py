@@ -0,0 +1,367 @@
+import os
+import sys
+import math
+import json
+import time
+import random
+import uuid
+import shutil
+import logging
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional
+from accelerate import init_empty_weights
+from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer, TrainingArguments, TrainerCallback
+from datasets import load_from_disk
+from .trainer import prepare_trainer
+from .export import export_onnx
+from .utils import preprocess_data, save_training_metrics
+
+DATASET_DIRNAME = "dataset"
+TOKENIZER_DIRNAME = "tokenizer"
+TRIALS_DIRNAME = "trials"
+FINAL_MODEL_DIRNAME = "model"
+LEADERBOARD_FILENAME = "leaderboard.json"
+# fp32 weights and gradients plus AdamW's two moment estimates.
+TRAINING_BYTES_PER_PARAMETER = 16
+# Leaves room for activations, the data loader and the rest of the host.
+SWEEP_MEMORY_FRACTION = 0.75
+
+def available_cores() -> int:
+    """Returns the number of CPU cores this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def available_memory_bytes() -> Optional[int]:
+    """Returns the memory available for new processes in bytes, or None if it cannot be read."""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def estimate_trial_memory_bytes(base_model: str) -> int:
+    """
+    Estimates the memory one trial needs to fine-tune `base_model`: its fp32 weights,
+    gradients and AdamW states. The model is built on the meta device, so nothing is allocated.
+    """
+    with init_empty_weights():
+        model = AutoModelForCausalLM.from_config(AutoConfig.from_pretrained(base_model))
+    # Tied embeddings are one parameter, as after from_pretrained.
+    model.tie_weights()
+    return sum(param.numel() for param in model.parameters()) * TRAINING_BYTES_PER_PARAMETER
+
+def sweep_workers(sweep_config: Dict, num_trials: int, trial_memory_bytes: int) -> int:
+    """
+    Returns the number of trials to train at once.
+
+    An explicit `sweep.max_workers` is used as given. Otherwise as many trials run as the
+    cores allow at `sweep.threads_per_trial` threads each, and as fit in
+    `SWEEP_MEMORY_FRACTION` of the available memory at `trial_memory_bytes` each.
+    """
+    logger = logging.getLogger(__name__)
+    memory = available_memory_bytes()
+    memory_workers = None
+    if memory is not None and trial_memory_bytes > 0:
+        memory_workers = max(1, int(memory * SWEEP_MEMORY_FRACTION) // trial_memory_bytes)
+
+    max_workers = sweep_config.get('max_workers', 0)
+    if max_workers:
+        if memory_workers is not None and max_workers > memory_workers:
+            logger.warning(f"sweep.max_workers={max_workers} trials may need more than the available memory; "
+                           f"{memory_workers} would fit.")
+    else:
+        max_workers = max(1, available_cores() // sweep_config.get('threads_per_trial', 1))
+        if memory_workers is not None:
+            max_workers = min(max_workers, memory_workers)
+    return max(1, min(max_workers, num_trials))
+
+def default_sweep_dir(config: Dict, use_case: str) -> str:
+    """Returns a new, uniquely named working directory for a sweep under `sweep.output_dir`."""
+    name = f"{use_case.replace(' ', '_')}_{time.strftime('%Y%m%d-%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    return os.path.join(config['sweep']['output_dir'], name)
+
+def build_trials(search_space: Dict[str, List], num_trials: int = 0, seed: int = 42) -> List[Dict]:
+    """
+    Expands a search space into trial hyperparameters.
+
+    Args:
+        search_space (Dict[str, List]): Candidate values per hyperparameter.
+        num_trials (int): Number of grid points to sample at random. 0 runs the full grid.
+        seed (int): Seed for sampling. Defaults to 42.
+
+    Returns:
+        List[Dict]: One dictionary of hyperparameters per trial.
+
+    Raises:
+        ValueError: If the search space is empty.
+    """
+    if not search_space or any(not values for values in search_space.values()):
+        raise ValueError("The search space must give at least one value for every hyperparameter.")
+    names = sorted(search_space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*(search_space[name] for name in names))]
+    if 0 < num_trials < len(grid):
+        grid = random.Random(seed).sample(grid, num_trials)
+    return grid
+
+def rung_budgets(min_steps: int, max_steps: int, eta: int) -> List[int]:
+    """
+    Returns the cumulative training steps of each successive-halving rung: `min_steps`
+    multiplied by `eta` per rung, ending at exactly `max_steps`.
+    """
+    if min_steps <= 0 or max_steps < min_steps or eta < 2:
+        raise ValueError("Successive halving needs 0 < min_steps <= max_steps and eta >= 2.")
+    budgets = [min_steps]
+    while budgets[-1] < max_steps:
+        budgets.append(min(budgets[-1] * eta, max_steps))
+    return budgets
+
+def _init_worker(threads_per_trial: int) -> None:
+    import numpy as np
+    import torch
+    torch.set_num_threads(threads_per_trial)
+    # Resuming a trial loads the numpy RNG state pickled into its checkpoint, which
+    # torch>=2.6 refuses to unpickle by default.
+    if hasattr(torch.serialization, "add_safe_globals"):
+        numpy_core = getattr(np, "_core", None) or np.core
+        torch.serialization.add_safe_globals([
+            numpy_core.multiarray._reconstruct, np.ndarray, np.dtype, type(np.dtype(np.uint32)),
+        ])
+
+class _StopAtStep(TrainerCallback):
+    """Checkpoints and stops training once a rung's step budget is reached."""
+    def __init__(self, budget: int):
+        self.budget = budget
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if state.global_step >= self.budget:
+            control.should_save = True
+            control.should_training_stop = True
+        return control
+
+def _run_trial(trial_id: int, params: Dict, steps: int, final: bool, sweep_dir: str,
+               base_model: str, sweep_config: Dict) -> Dict:
+    """
+    Trains one trial up to `steps` total optimizer steps and evaluates it.
+
+    The learning rate schedule always spans `sweep.max_steps`, and each rung stops at its
+    budget, so a trial follows one schedule across rungs, as a single full-length run
+    would. A trial resumes from the checkpoint of its previous rung, so each rung only
+    trains the additional steps. Runs in a pool worker.
+    """
+    logger = logging.getLogger(__name__)
+    trial_dir = os.path.join(sweep_dir, TRIALS_DIRNAME, f"trial_{trial_id}")
+    start = time.perf_counter()
+
+    tokenizer = AutoTokenizer.from_pretrained(os.path.join(sweep_dir, TOKENIZER_DIRNAME))
+    model = AutoModelForCausalLM.from_pretrained(base_model)
+    dataset = load_from_disk(os.path.join(sweep_dir, DATASET_DIRNAME))
+
+    training_args = TrainingArguments(
+        output_dir=trial_dir,
+        max_steps=sweep_config['max_steps'],
+        per_device_train_batch_size=int(params.get('batch_size', 8)),
+        per_device_eval_batch_size=int(params.get('batch_size', 8)),
+        learning_rate=float(params.get('learning_rate', 2e-5)),
+        weight_decay=float(params.get('weight_decay', 0.0)),
+        warmup_ratio=float(params.get('warmup_ratio', 0.0)),
+        # _StopAtStep saves a checkpoint at the end of each rung.
+        save_strategy="no",
+        save_total_limit=1,
+        logging_steps=sweep_config['min_steps'],
+        evaluation_strategy="no",
+        report_to=[],
+        disable_tqdm=True,
+        seed=sweep_config.get('seed', 42),
+        save_safetensors=True,
+    )
+    trainer = prepare_trainer(model, tokenizer, training_args, dataset['train'])
+    trainer.add_callback(_StopAtStep(steps))
+    resume = os.path.isdir(trial_dir) and any(name.startswith("checkpoint-") for name in os.listdir(trial_dir))
+    trainer.train(resume_from_checkpoint=resume)
+    eval_loss = trainer.evaluate(eval_dataset=dataset['test'])['eval_loss']
+
+    if final:
+        trainer.save_model(os.path.join(trial_dir, FINAL_MODEL_DIRNAME))
+        tokenizer.save_pretrained(os.path.join(trial_dir, FINAL_MODEL_DIRNAME))
+
+    logger.info(f"Trial {trial_id} {params} reached {steps} steps with eval loss {eval_loss:.4f}")
+    return {"steps": steps, "eval_loss": eval_loss, "seconds": time.perf_counter() - start}
+
+def _loss_key(trial: Dict) -> float:
+    loss = trial['eval_loss']
+    return math.inf if loss is None or math.isnan(loss) else loss
+
+def write_leaderboard(trials: List[Dict], path: str) -> List[Dict]:
+    """
+    Ranks trials by the rung they reached, then by eval loss, and writes them to a JSON file.
+
+    Returns:
+        List[Dict]: The ranked trials.
+    """
+    ranked = sorted(trials, key=lambda trial: (-trial['steps'], _loss_key(trial)))
+    for rank, trial in enumerate(ranked, start=1):
+        trial['rank'] = rank
+    with open(path, 'w') as f:
+        json.dump(ranked, f, indent=4)
+    return ranked
+
+def promote_model(model_path: str, model_dir: str, use_case: str, metrics: Dict, config: Dict) -> Dict:
+    """
+    Publishes a sweep's best model as the next serving version of a use case.
+
+    Args:
+        model_path (str): Directory of the trained model.
+        model_dir (str): Directory containing fine-tuned models.
+        use_case (str): The use case the model was fine-tuned for.
+        metrics (Dict): Metrics to record in the model index.
+        config (Dict): Pipeline configuration.
+
+    Returns:
+        Dict: The index entry of the published model.
+    """
+    from deployment.model_index import create_staging_dir, publish_model
+
+    staging_dir = create_staging_dir(model_dir)
+    try:
+        shutil.copytree(model_path, staging_dir, dirs_exist_ok=True)
+        save_training_metrics(metrics, staging_dir)
+        if config['training'].get('export_onnx', False):
+            export_onnx(staging_dir, quantize_int8=config['training'].get('onnx_int8', False))
+        return publish_model(staging_dir, model_dir, use_case, metrics)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+def run_sweep(raw_data: List[Dict[str, str]], use_case: str, config: Dict, sweep_dir: Optional[str] = None) -> Dict:
+    """
+    Runs a hyperparameter sweep with successive halving and promotes the best model.
+
+    The data is tokenized once and saved as an Arrow dataset that every trial memory-maps.
+    Trials run in a process pool sized to the available cores and memory (see
+    `sweep_workers`). After each rung only the
+    `1/eta` trials with the lowest eval loss train on, for `eta` times as many steps; the
+    checkpoints of pruned trials are deleted. The survivor of the last rung is published
+    to `model.finetuned_model_dir`.
+
+    Args:
+        raw_data (List[Dict[str, str]]): The dataset to fine-tune on.
+        use_case (str): The specific use case being fine-tuned for.
+        config (Dict): Pipeline configuration, with the sweep settings under `sweep`.
+        sweep_dir (Optional[str]): Working directory for the sweep. Defaults to
+            `default_sweep_dir(config, use_case)`.
+
+    Returns:
+        Dict: The ranked leaderboard, the best trial and the index entry of the promoted model.
+
+    Raises:
+        RuntimeError: If every trial fails.
+    """
+    logger = logging.getLogger(__name__)
+    sweep_config = config['sweep']
+    base_model = config['model']['base_model']
+    seed = sweep_config.get('seed', 42)
+
+    if sweep_dir is None:
+        sweep_dir = default_sweep_dir(config, use_case)
+    os.makedirs(sweep_dir, exist_ok=True)
+
+    # Tokenize once; trials load the saved dataset instead of re-tokenizing.
+    logger.info("Preprocessing data for the sweep...")
+    tokenizer = AutoTokenizer.from_pretrained(base_model)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    dataset = preprocess_data(raw_data, tokenizer, max_length=sweep_config.get('max_length', 512))
+    dataset = dataset.train_test_split(test_size=sweep_config.get('eval_fraction', 0.1), seed=seed)
+    dataset.save_to_disk(os.path.join(sweep_dir, DATASET_DIRNAME))
+    tokenizer.save_pretrained(os.path.join(sweep_dir, TOKENIZER_DIRNAME))
+
+    budgets = rung_budgets(sweep_config['min_steps'], sweep_config['max_steps'], sweep_config.get('eta', 3))
+    trials = [
+        {"trial_id": trial_id, "params": params, "status": "running", "steps": 0, "eval_loss": None, "history": []}
+        for trial_id, params in enumerate(build_trials(sweep_config['search_space'], sweep_config.get('num_trials', 0), seed))
+    ]
+    threads_per_trial = sweep_config.get('threads_per_trial', 1)
+    max_workers = sweep_workers(sweep_config, len(trials), estimate_trial_memory_bytes(base_model))
+    logger.info(f"Sweeping {len(trials)} trials over rungs {budgets} with {max_workers} workers.")
+
+    # Spawned workers do not inherit the parent's torch and tokenizer thread pools.
+    context = multiprocessing.get_context("spawn")
+    survivors = trials
+    with ProcessPoolExecutor(max_workers, mp_context=context, initializer=_init_worker, initargs=(threads_per_trial,)) as pool:
+        for rung, budget in enumerate(budgets):
+            final = rung == len(budgets) - 1
+            futures = {
+                trial['trial_id']: pool.submit(_run_trial, trial['trial_id'], trial['params'], budget, final,
+                                               sweep_dir, base_model, sweep_config)
+                for trial in survivors
+            }
+            for trial in survivors:
+                try:
+                    result = futures[trial['trial_id']].result()
+                except Exception as e:
+                    logger.error(f"Trial {trial['trial_id']} failed: {str(e)}")
+                    trial['status'] = "failed"
+                    trial['error'] = str(e)
+                    continue
+                trial['steps'] = result['steps']
+                trial['eval_loss'] = result['eval_loss']
+                trial['history'].append(result)
+
+            survivors = sorted((trial for trial in survivors if trial['status'] != "failed"), key=_loss_key)
+            if not survivors:
+                write_leaderboard(trials, os.path.join(sweep_dir, LEADERBOARD_FILENAME))
+                raise RuntimeError("Every trial of the sweep failed.")
+            if final:
+                break
+
+            keep = max(1, len(survivors) // sweep_config.get('eta', 3))
+            for trial in survivors[keep:]:
+                trial['status'] = "pruned"
+                shutil.rmtree(os.path.join(sweep_dir, TRIALS_DIRNAME, f"trial_{trial['trial_id']}"), ignore_errors=True)
+            survivors = survivors[:keep]
+            logger.info(f"Rung {rung} at {budget} steps kept trials {[trial['trial_id'] for trial in survivors]}")
+
+    for trial in survivors:
+        trial['status'] = "completed"
+    leaderboard = write_leaderboard(trials, os.path.join(sweep_dir, LEADERBOARD_FILENAME))
+    best = leaderboard[0]
+    logger.info(f"Best trial {best['trial_id']} {best['params']} with eval loss {best['eval_loss']:.4f}")
+
+    published = None
+    if sweep_config.get('promote', True):
+        best_path = os.path.join(sweep_dir, TRIALS_DIRNAME, f"trial_{best['trial_id']}", FINAL_MODEL_DIRNAME)
+        metrics = {"eval_loss": best['eval_loss'], "steps": best['steps'], **best['params']}
+        published = promote_model(best_path, config['model']['finetuned_model_dir'], use_case, metrics, config)
+
+    return {"sweep_dir": sweep_dir, "leaderboard": leaderboard, "best": best, "published": published}
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a successive-halving hyperparameter sweep and promote the best model.")
+    parser.add_argument("--data", required=True, help="JSON file with a list of {input, output} samples.")
+    parser.add_argument("--use-case", required=True, help="Use case the model is fine-tuned for.")
+    parser.add_argument("--config", default="config/config.yaml", help="Pipeline configuration file.")
+    parser.add_argument("--sweep-dir", default=None, help="Working directory for the sweep.")
+    args = parser.parse_args(argv)
+
+    from data_generation.utils import load_config
+    logging.basicConfig(level=logging.INFO)
+    config = load_config(args.config)
+    with open(args.data, 'r') as f:
+        raw_data = json.load(f)
+
+    result = run_sweep(raw_data, args.use_case, config, args.sweep_dir)
+    print(json.dumps({key: result[key] for key in ("sweep_dir", "best", "published")}, indent=4))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
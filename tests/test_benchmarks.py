@@ -0,0 +1,39 @@
+import unittest
+from unittest.mock import patch
+from benchmarks.fixtures import StubCompletionClient
+from benchmarks.run_benchmarks import compare_results
+from data_generation.data_generator import generate_synthetic_data
+
+def _results(**values):
+    directions = {"predict.p50_ms": False, "training.steps_per_sec": True}
+    return {
+        "metrics": {
+            name: {"value": value, "unit": "", "higher_is_better": directions[name]}
+            for name, value in values.items()
+        }
+    }
+
+class TestBenchmarks(unittest.TestCase):
+    def test_compare_results_flags_regressions(self):
+        baseline = _results(**{"predict.p50_ms": 100.0, "training.steps_per_sec": 10.0})
+        current = _results(**{"predict.p50_ms": 150.0, "training.steps_per_sec": 5.0})
+
+        regressions = compare_results(current, baseline, tolerance=0.2)
+
+        self.assertEqual({r["metric"] for r in regressions}, {"predict.p50_ms", "training.steps_per_sec"})
+
+    def test_compare_results_within_tolerance(self):
+        baseline = _results(**{"predict.p50_ms": 100.0, "training.steps_per_sec": 10.0})
+        current = _results(**{"predict.p50_ms": 110.0, "training.steps_per_sec": 20.0})
+
+        self.assertEqual(compare_results(current, baseline, tolerance=0.2), [])
+
+    def test_stub_completion_client(self):
+        raw_data = [{"input": "Sample question?", "output": "Sample answer."}] * 3
+        with patch('data_generation.data_generator.OpenAI', lambda **kwargs: StubCompletionClient(raw_data, **kwargs)):
+            data = generate_synthetic_data("customer support", num_samples=3)
+
+        self.assertEqual(data, raw_data)
+
+if __name__ == '__main__':
+    unittest.main()
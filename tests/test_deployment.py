@@ -1,7 +1,29 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from deployment.serve_model import ModelServer
+from deployment.serve_model import ModelServer, RESIDENT_MODELS, RESIDENT_MODEL_BYTES
+from deployment.prefork import PreforkModelServer
+from deployment.model_index import create_staging_dir, publish_model, load_index
+from deployment.hot_swap import ModelIndexWatcher
+from deployment.utils import get_latest_model_path
+from finetuning.export import export_onnx
+from deployment.metrics import REGISTRY, REQUEST_SECONDS, GENERATED_TOKENS, Histogram
+from benchmarks.fixtures import build_tiny_model, load_sample_data
+from transformers import AutoModelForCausalLM, GenerationConfig
 import os
+import signal
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
+import torch
+
+class _RecordScores:
+    def __init__(self, scores):
+        self.scores = scores
+    
+    def __call__(self, input_ids, scores):
+        self.scores.append(scores.clone())
+        return scores
 
 class TestDeployment(unittest.TestCase):
     @patch('deployment.serve_model.AutoTokenizer')
@@ -56,5 +78,325 @@ class TestDeployment(unittest.TestCase):
         if os.path.exists(model_path):
             os.rmdir(model_path)
 
+    def test_model_server_mmap_weights(self):
+        with tempfile.TemporaryDirectory() as model_path:
+            build_tiny_model(model_path, load_sample_data()[:20])
+            
+            server = ModelServer(model_path, mmap_weights=True, warmup=True)
+            reference = AutoModelForCausalLM.from_pretrained(model_path).eval()
+            
+            input_ids = torch.tensor([[1, 5, 6, 7]])
+            with torch.no_grad():
+                self.assertTrue(torch.allclose(server.model(input_ids).logits, reference(input_ids).logits))
+            
+            metrics = ModelServer.get_startup_metrics()[model_path]
+            self.assertTrue(metrics["mmap_weights"])
+            self.assertIsNotNone(metrics["first_token_ms"])
+            self.assertGreater(metrics["rss_bytes"], 0)
+            
+            ModelServer._model_cache.pop(model_path)
+            ModelServer._tokenizer_cache.pop(model_path)
+
+    def test_model_server_mmap_generation_config(self):
+        with tempfile.TemporaryDirectory() as model_path:
+            build_tiny_model(model_path, load_sample_data()[:20])
+            GenerationConfig(do_sample=True, temperature=0.6, bos_token_id=1, eos_token_id=[2, 3]).save_pretrained(model_path)
+            
+            server = ModelServer(model_path, mmap_weights=True)
+            reference = AutoModelForCausalLM.from_pretrained(model_path)
+            
+            self.assertTrue(server.mmap_weights)
+            for name in ("do_sample", "temperature", "eos_token_id"):
+                self.assertEqual(getattr(server.model.generation_config, name), getattr(reference.generation_config, name))
+            self.assertEqual(server.model.generation_config.eos_token_id, [2, 3])
+            
+            ModelServer.evict(model_path)
+
+    def test_prefork_model_server(self):
+        with tempfile.TemporaryDirectory() as model_path:
+            build_tiny_model(model_path, load_sample_data()[:20])
+            expected = ModelServer(model_path).predict("Test prompt")
+            
+            # ONNX Runtime sessions are not shared across forks, so each worker would copy the weights.
+            with self.assertRaises(ValueError):
+                PreforkModelServer([model_path], num_workers=2, backend="onnx")
+            
+            server = PreforkModelServer([model_path], num_workers=2)
+            try:
+                futures = [server.submit(model_path, "Test prompt") for _ in range(4)]
+                self.assertEqual([f.result(timeout=60) for f in futures], [expected] * 4)
+                
+                # A crashed worker is replaced and the pool keeps serving.
+                crashed_pid = server.stats()[0]["pid"]
+                os.kill(crashed_pid, signal.SIGKILL)
+                while server.stats()[0]["pid"] == crashed_pid:
+                    time.sleep(0.05)
+                self.assertEqual(server.predict(model_path, "Test prompt"), expected)
+                self.assertEqual(len(server.stats()), 2)
+            finally:
+                server.shutdown()
+            
+            ModelServer._model_cache.pop(model_path)
+            ModelServer._tokenizer_cache.pop(model_path)
+
+    def test_prefork_model_server_burst(self):
+        with tempfile.TemporaryDirectory() as model_path:
+            build_tiny_model(model_path, load_sample_data()[:20])
+            server = PreforkModelServer([model_path], num_workers=1)
+            try:
+                # Enough queued requests and results to fill both directions of the worker's pipe.
+                prompt = " ".join(["health"] * 4000)
+                with ThreadPoolExecutor(max_workers=8) as pool:
+                    futures = list(pool.map(lambda _: server.submit(model_path, prompt, max_length=4001), range(100)))
+                self.assertEqual(len([f.result(timeout=120) for f in futures]), 100)
+            finally:
+                server.shutdown()
+            
+            ModelServer.evict(model_path)
+
+    def test_prefork_rolling_load(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            v1, v2 = os.path.join(work_dir, "v1"), os.path.join(work_dir, "v2")
+            build_tiny_model(v1, load_sample_data()[:20], seed=1)
+            build_tiny_model(v2, load_sample_data()[:20], seed=2)
+            expected = ModelServer(v2).predict("Test prompt")
+            ModelServer.evict(v2)
+            
+            server = PreforkModelServer([v1], num_workers=2)
+            try:
+                # The tiny models are the same size.
+                v1_bytes = sum(param.numel() * param.element_size() for param in ModelServer._model_cache[v1].parameters())
+                models_before, bytes_before = RESIDENT_MODELS.value(), RESIDENT_MODEL_BYTES.value()
+                old_pids = {worker["pid"] for worker in server.stats()}
+                stop = threading.Event()
+                
+                def client():
+                    results = []
+                    while not stop.is_set():
+                        results.append(server.predict(v1, "Test prompt"))
+                    return results
+                
+                # Requests keep being served by the other workers while each one is replaced.
+                with ThreadPoolExecutor(max_workers=2) as pool:
+                    clients = [pool.submit(client) for _ in range(2)]
+                    server.load_model(v2)
+                    stop.set()
+                    self.assertTrue(all(len(c.result(timeout=60)) > 0 for c in clients))
+                
+                self.assertTrue(old_pids.isdisjoint(worker["pid"] for worker in server.stats()))
+                self.assertEqual(server.predict(v2, "Test prompt"), expected)
+                
+                # v2 was only loaded in the template, and the gauges report it.
+                self.assertNotIn(v2, ModelServer._model_cache)
+                self.assertEqual(RESIDENT_MODELS.value(), models_before + 1)
+                self.assertEqual(RESIDENT_MODEL_BYTES.value(), bytes_before + v1_bytes)
+                server.evict_model(v1)
+                self.assertEqual(RESIDENT_MODELS.value(), models_before)
+                self.assertEqual(RESIDENT_MODEL_BYTES.value(), bytes_before)
+            finally:
+                server.shutdown()
+            
+            ModelServer.evict(v1)
+            ModelServer.evict(v2)
+
+    def test_onnx_backend_parity(self):
+        with tempfile.TemporaryDirectory() as model_path:
+            build_tiny_model(model_path, load_sample_data()[:50])
+            export_onnx(model_path, quantize_int8=True)
+            
+            torch_server = ModelServer(model_path)
+            onnx_server = ModelServer(model_path, backend="onnx")
+            for item in load_sample_data()[:5]:
+                self.assertEqual(onnx_server.predict(item["input"]), torch_server.predict(item["input"]))
+            
+            # Int8 weights stay close to fp32: first-step logits within a fraction of their spread,
+            # and nearly the same greedy tokens.
+            int8_server = ModelServer(model_path, backend="onnx", onnx_int8=True)
+            agreed = total = 0
+            for item in load_sample_data()[:5]:
+                inputs = onnx_server.tokenizer(item["input"], return_tensors="pt")
+                prompt_length = inputs["input_ids"].shape[1]
+                fp32_scores, int8_scores = [], []
+                fp32 = onnx_server.model.generate(**inputs, max_new_tokens=20, logits_processor=[_RecordScores(fp32_scores)])[0]
+                int8 = int8_server.model.generate(**inputs, max_new_tokens=20, logits_processor=[_RecordScores(int8_scores)])[0]
+                self.assertLess(float((fp32_scores[0] - int8_scores[0]).abs().max()), 0.15 * float(fp32_scores[0].std()))
+                length = min(len(fp32), len(int8))
+                agreed += int((fp32[prompt_length:length] == int8[prompt_length:length]).sum())
+                total += length - prompt_length
+            self.assertGreaterEqual(agreed / total, 0.9)
+            
+            ModelServer.evict(model_path)
+            self.assertNotIn(ModelServer.cache_key(model_path, "onnx"), ModelServer._model_cache)
+
+    def test_onnx_backend_eos_token_list(self):
+        with tempfile.TemporaryDirectory() as model_path:
+            build_tiny_model(model_path, load_sample_data()[:50])
+            export_onnx(model_path)
+            prompt = load_sample_data()[0]["input"]
+            
+            # Make a token the model actually generates a second EOS id, as Llama 3.2 Instruct does.
+            server = ModelServer(model_path)
+            inputs = server.tokenizer(prompt, return_tensors="pt")
+            with torch.no_grad():
+                generated = server.model.generate(**inputs, max_new_tokens=5, no_repeat_ngram_size=2)
+            stop_token = int(generated[0, inputs["input_ids"].shape[1] + 2])
+            ModelServer.evict(model_path)
+            GenerationConfig(bos_token_id=1, eos_token_id=[2, stop_token], pad_token_id=0).save_pretrained(model_path)
+            
+            torch_server = ModelServer(model_path)
+            expected = torch_server.predict(prompt)
+            self.assertEqual(ModelServer(model_path, backend="onnx").predict(prompt), expected)
+            # Generation stopped at the extra EOS id.
+            self.assertLessEqual(len(torch_server.tokenizer(expected)["input_ids"]), inputs["input_ids"].shape[1] + 3)
+            
+            ModelServer.evict(model_path)
+
+    def test_onnx_backend_external_data(self):
+        import onnx
+        with tempfile.TemporaryDirectory() as model_path:
+            build_tiny_model(model_path, load_sample_data()[:50])
+            onnx_path = export_onnx(model_path, quantize_int8=True)
+            expected = ModelServer(model_path, backend="onnx").predict("Test prompt")
+            ModelServer.evict(model_path)
+            # Store the weights outside the graph file, as exports over protobuf's 2 GB limit do.
+            onnx.save_model(onnx.load(onnx_path), onnx_path, save_as_external_data=True,
+                            all_tensors_to_one_file=False, size_threshold=0)
+            onnx_dir = os.path.dirname(onnx_path)
+
+            server = ModelServer(model_path, backend="onnx")
+            self.assertEqual(server.predict("Test prompt"), expected)
+            weight_bytes = sum(param.numel() * 4 for param in AutoModelForCausalLM.from_pretrained(model_path).parameters())
+            self.assertLess(os.path.getsize(onnx_path), weight_bytes)
+            self.assertGreaterEqual(server.model.nbytes, weight_bytes)
+
+            # The int8 weights are written to an external-data file too, and counted.
+            int8 = ModelServer(model_path, backend="onnx", onnx_int8=True).model
+            self.assertTrue(os.path.exists(os.path.join(onnx_dir, "model.int8.onnx.data")))
+            self.assertEqual(int8.nbytes, os.path.getsize(int8.onnx_path) + os.path.getsize(os.path.join(onnx_dir, "model.int8.onnx.data")))
+            self.assertLess(int8.nbytes, server.model.nbytes)
+
+            ModelServer.evict(model_path)
+
+    def test_onnx_backend_sampling(self):
+        with tempfile.TemporaryDirectory() as model_path:
+            build_tiny_model(model_path, load_sample_data()[:50])
+            export_onnx(model_path)
+            # The sampling defaults Llama 3.2 Instruct fine-tunes inherit.
+            GenerationConfig(bos_token_id=1, eos_token_id=2, pad_token_id=0,
+                             do_sample=True, temperature=0.6, top_p=0.9).save_pretrained(model_path)
+            prompt = load_sample_data()[0]["input"]
+
+            torch_server = ModelServer(model_path)
+            onnx_server = ModelServer(model_path, backend="onnx")
+            onnx_predictions = set()
+            for seed in range(5):
+                torch.manual_seed(seed)
+                expected = torch_server.predict(prompt)
+                torch.manual_seed(seed)
+                prediction = onnx_server.predict(prompt)
+                self.assertEqual(prediction, expected)
+                onnx_predictions.add(prediction)
+            self.assertGreater(len(onnx_predictions), 1)
+
+            inputs = onnx_server.tokenizer(prompt, return_tensors="pt")
+            with self.assertRaises(TypeError):
+                onnx_server.model.generate(**inputs, max_new_tokens=5, num_beams=4)
+
+            ModelServer.evict(model_path)
+
+    def test_prediction_metrics(self):
+        with tempfile.TemporaryDirectory() as model_path:
+            build_tiny_model(model_path, load_sample_data()[:20])
+            server = ModelServer(model_path)
+            
+            _, timings = server.generate_with_timings("Test prompt", max_length=20)
+            self.assertGreater(timings["prefill_seconds"], 0)
+            self.assertGreater(timings["decode_seconds"], 0)
+            self.assertEqual(timings["prompt_tokens"] + timings["generated_tokens"], 20)
+            
+            requests_before = REQUEST_SECONDS.count()
+            tokens_before = GENERATED_TOKENS.value()
+            server.predict("Test prompt", max_length=20)
+            self.assertEqual(REQUEST_SECONDS.count(), requests_before + 1)
+            self.assertEqual(GENERATED_TOKENS.value(), tokens_before + timings["generated_tokens"])
+            self.assertIn("llm_resident_model_bytes", REGISTRY.render())
+            
+            ModelServer.evict(model_path)
+    
+    def test_histogram_render(self):
+        histogram = Histogram("test_seconds", "Test histogram.", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value)
+        
+        lines = histogram.render().splitlines()
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn("test_seconds_count 3", lines)
+    
+    def _publish(self, model_dir, use_case):
+        staging_dir = create_staging_dir(model_dir)
+        with open(os.path.join(staging_dir, "config.json"), "w") as f:
+            f.write("{}")
+        return publish_model(staging_dir, model_dir, use_case, metrics={"loss": 0.1})
+    
+    def test_publish_model(self):
+        with tempfile.TemporaryDirectory() as model_dir:
+            first = self._publish(model_dir, "customer support")
+            second = self._publish(model_dir, "customer support")
+            # A model still being written must never be picked up as the latest one.
+            create_staging_dir(model_dir)
+            
+            self.assertEqual((first["version"], second["version"]), (1, 2))
+            self.assertEqual(second["path"], os.path.join("finetuned_customer_support", "v2"))
+            self.assertEqual(first["sha256"], second["sha256"])
+            self.assertEqual(len(load_index(model_dir)["models"]), 2)
+            self.assertEqual(get_latest_model_path(model_dir), os.path.join(model_dir, second["path"]))
+    
+    def test_model_index_watcher_hot_swap(self):
+        with tempfile.TemporaryDirectory() as model_dir:
+            loaded, unloaded = [], []
+            watcher = ModelIndexWatcher(model_dir, loaded.append, unloaded.append)
+            v1 = os.path.join(model_dir, self._publish(model_dir, "support")["path"])
+            
+            with watcher.use("support") as in_flight_path:
+                self.assertEqual(in_flight_path, v1)
+                v2 = os.path.join(model_dir, self._publish(model_dir, "support")["path"])
+                watcher.refresh()
+                
+                self.assertEqual(loaded, [v2])
+                with watcher.use("support") as model_path:
+                    self.assertEqual(model_path, v2)
+                # v1 still has a request in flight.
+                self.assertEqual(unloaded, [])
+            
+            watcher.refresh()
+            self.assertEqual(unloaded, [v1])
+            with watcher.use("support", version=1) as model_path:
+                self.assertEqual(model_path, v1)
+
+    def test_model_index_watcher_pinned_version_idle(self):
+        with tempfile.TemporaryDirectory() as model_dir:
+            unloaded = []
+            watcher = ModelIndexWatcher(model_dir, lambda path: None, unloaded.append, pinned_idle_timeout=0.0)
+            v1 = os.path.join(model_dir, self._publish(model_dir, "support")["path"])
+            v2 = os.path.join(model_dir, self._publish(model_dir, "support")["path"])
+            
+            with watcher.use("support") as model_path:
+                self.assertEqual(model_path, v2)
+            with watcher.use("support", version=1) as model_path:
+                self.assertEqual(model_path, v1)
+                watcher.refresh()
+                # A pinned version is not released while it serves a request.
+                self.assertEqual(unloaded, [])
+            # Pinned versions are resolved once, and later requests do not read the index.
+            with patch('deployment.hot_swap.load_index') as mock_load_index:
+                with watcher.use("support", version=1) as model_path:
+                    self.assertEqual(model_path, v1)
+                mock_load_index.assert_not_called()
+            
+            watcher._unload_drained()
+            self.assertEqual(unloaded, [v1])
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,14 @@
 import unittest
 from unittest.mock import patch, MagicMock
 from finetuning.finetune import finetune_model
+from finetuning.sweep import run_sweep, rung_budgets, sweep_workers, estimate_trial_memory_bytes
+from deployment.model_index import load_index
+from benchmarks.fixtures import build_tiny_model, load_sample_data
+from transformers import AutoModelForCausalLM
+import json
 import os
 import shutil
+import tempfile
 
 class TestFinetuning(unittest.TestCase):
     @patch('finetuning.finetune.AutoTokenizer')
@@ -67,5 +73,69 @@ class TestFinetuning(unittest.TestCase):
         # Ensure no model is saved
         self.assertFalse(os.path.exists(output_dir))
 
+    def test_rung_budgets(self):
+        self.assertEqual(rung_budgets(50, 450, 3), [50, 150, 450])
+        self.assertEqual(rung_budgets(2, 5, 2), [2, 4, 5])
+        with self.assertRaises(ValueError):
+            rung_budgets(10, 5, 3)
+
+    def test_sweep_workers(self):
+        # 8 cores, but 60 GB available fits only two 20 GB trials in the 75% budget.
+        with patch('finetuning.sweep.available_cores', return_value=8), \
+                patch('finetuning.sweep.available_memory_bytes', return_value=60 * 2 ** 30):
+            self.assertEqual(sweep_workers({'max_workers': 0}, 6, 20 * 2 ** 30), 2)
+            self.assertEqual(sweep_workers({'max_workers': 0}, 6, 2 ** 30), 6)
+            self.assertEqual(sweep_workers({'max_workers': 0, 'threads_per_trial': 4}, 6, 2 ** 30), 2)
+            self.assertEqual(sweep_workers({'max_workers': 0}, 6, 100 * 2 ** 30), 1)
+            self.assertEqual(sweep_workers({'max_workers': 4}, 6, 20 * 2 ** 30), 4)
+
+        with tempfile.TemporaryDirectory() as model_path:
+            build_tiny_model(model_path, load_sample_data()[:20])
+            model = AutoModelForCausalLM.from_pretrained(model_path)
+            num_params = sum(param.numel() for param in model.parameters())
+            self.assertEqual(estimate_trial_memory_bytes(model_path), 16 * num_params)
+
+    def test_run_sweep(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            raw_data = load_sample_data()[:40]
+            base_model = os.path.join(work_dir, "base")
+            build_tiny_model(base_model, raw_data)
+            model_dir = os.path.join(work_dir, "models")
+            config = {
+                "model": {"base_model": base_model, "finetuned_model_dir": model_dir},
+                "training": {},
+                "sweep": {
+                    "search_space": {"learning_rate": [1e-2, 1e-7], "batch_size": [4]},
+                    "min_steps": 2,
+                    "max_steps": 4,
+                    "eta": 2,
+                    "eval_fraction": 0.2,
+                    "max_length": 32,
+                },
+            }
+
+            result = run_sweep(raw_data, "health", config, os.path.join(work_dir, "sweep"))
+
+            leaderboard = result["leaderboard"]
+            self.assertEqual([trial["status"] for trial in leaderboard], ["completed", "pruned"])
+            self.assertEqual(leaderboard[0]["steps"], 4)
+            self.assertEqual(leaderboard[0]["params"]["learning_rate"], 1e-2)
+            self.assertEqual([rung["steps"] for rung in leaderboard[0]["history"]], [2, 4])
+            with open(os.path.join(result["sweep_dir"], "leaderboard.json")) as f:
+                self.assertEqual(json.load(f), leaderboard)
+            # Rungs continue one learning rate schedule over max_steps instead of restarting it.
+            checkpoint = os.path.join(result["sweep_dir"], "trials", "trial_0", "checkpoint-4")
+            with open(os.path.join(checkpoint, "trainer_state.json")) as f:
+                learning_rates = {entry["step"]: entry["learning_rate"] for entry in json.load(f)["log_history"] if "learning_rate" in entry}
+            self.assertAlmostEqual(learning_rates[2], 0.5e-2)
+            self.assertAlmostEqual(learning_rates[4], 0.0)
+            # Pruned trials do not keep their checkpoints.
+            self.assertFalse(os.path.exists(os.path.join(result["sweep_dir"], "trials", "trial_1")))
+
+            entry = load_index(model_dir)["models"][0]
+            self.assertEqual(entry, result["published"])
+            self.assertEqual(entry["metrics"]["eval_loss"], leaderboard[0]["eval_loss"])
+            self.assertTrue(os.path.exists(os.path.join(model_dir, entry["path"], "model.safetensors")))
+
 if __name__ == '__main__':
     unittest.main()